@@ -8,106 +8,134 @@ the sea. These parameters are only estimated at the initial time (t=0)
 before the Tsunami waves start. Shallow water equations are then used to 
 propagate the resulting waves. 
 
+The GeoClaw forward model with checkpoint-restart of the ensemble members is
+`geoclaw_forward_model.GeoClawForwardModel`.
+
 """
 
 # Script originally adapted from matlab
 
+from __future__ import print_function
+
 import numpy
+import scipy.linalg
+
+
+def ensemble_anomalies(E):
+    r"""Scaled anomalies (E - mean(E)) / sqrt(Ne - 1) of the ensemble *E*
+
+    *E* has shape [N x Ne] with one ensemble member per column.
+    """
+    return (E - numpy.mean(E, axis=1)[:, numpy.newaxis]) \
+                                            / numpy.sqrt(E.shape[1] - 1)
+
+
+def observe(H, X):
+    r"""Apply the observation operator *H* to the state ensemble *X*
+
+    *H* may be a matrix of size [Ny x Nx] or a function mapping the state
+    ensemble to the observed ensemble.
+    """
+    if callable(H):
+        return H(X)
+    return numpy.dot(H, X)
+
 
-def swe_model(t, t_obs, fault_params=None):
-    r"""Evolve the shallow water model to t_observation from t_current
+def analysis_weights(HXf, Yc, R_factor):
+    r"""Ensemble space weights W of the EnKF analysis
+
+    The analysis of any ensemble E that is correlated with the observed
+    forecast *HXf* is `E + ensemble_anomalies(E) W`.  With L the Cholesky
+    factor of R, S = L^{-1} H Af and D = L^{-1} (Yc - H Xf) the Kalman update
+
+        K (Yc - H Xf) = Af (H Af)^T (H Af (H Af)^T + R)^{-1} (Yc - H Xf)
+                      = Af (I + S^T S)^{-1} S^T D
+
+    only needs a Cholesky solve with the [Ne x Ne] matrix I + S^T S, so the
+    cost scales with the ensemble size rather than the state dimension.
 
     Input
     -----
-     - *t* - (float) - Current time
-     - *t_obs* - (float) - Observation time, will run model to this time
-     - *fault_params* - (FaultData) - Data object containing fault specification,
-       if `fault_params = None` then continue from current time of model,
-       otherwise restart model with initial conditions using the 
-       `fault_params`.  Defaults to `None`.
+     - *HXf* - (ndarray) - Observed forecast ensemble, size = [Ny x Ne]
+     - *Yc* - (ndarray) - Perturbed observation ensemble, size = [Ny x Ne]
+     - *R_factor* - (ndarray) - Lower Cholesky factor of R, size = [Ny x Ny]
 
     Output
     ------
-     - state - (ndarray) - Vector form of the state of the model at `t_obs`.
+     - W - (ndarray) - Weights, size = [Ne x Ne]
     """
 
-    if fault_params is not None:
-        # Restart
-        raise NotImplemented("Restart not implemented yet.")
-    else:
-        # Continue to run GeoClaw forward
-        pass
-
-    return None
-
-def dual_ensemble_Kalman_filter(num_ensembles, num_obs, obs_times, t0, tf, t_observation, Xf, Pa, H, Y, R, sigma):
-    r"""
-
-    num_ensembles = Number of ensembles used
-    t0 = Initial time
-    t_observation = Time of observations
-    sigma = Standard error for perturbing the observations, size = [Ny x 1]
-
-
-    obs_times - (list) - List of observation times
-    Y - (ndarray(num_obs, len(obs_times)) - 
-
-    #
-    # In the Dual-EnKF, two parallel filters are simultaneously utilized for 
-    # the parameters and the state variables. First, the parameters might be
-    # propagated (here, kept unchanged) and then updated with available data of
-    # the state. The updated parameters are then used to integrate the state
-    # from the initial time to the current time. The data is then used again to
-    # update the state variables. 
-    #
-    # At the initial time, t0 we assume to have an ensemble of realizations
-    # for the parameters "Pa0" of size [Np x Ne] and another ensemble for the state 
-    # variables "Xa0" of size [Nx x Ne]. 
-    #
+    S = scipy.linalg.solve_triangular(R_factor, ensemble_anomalies(HXf),
+                                      lower=True)
+    D = scipy.linalg.solve_triangular(R_factor, Yc - HXf, lower=True)
+    C = numpy.eye(S.shape[1]) + numpy.dot(S.T, S)
+    return scipy.linalg.cho_solve(scipy.linalg.cho_factor(C, lower=True),
+                                  numpy.dot(S.T, D))
+
+
+def dual_ensemble_Kalman_filter(forward_model, Pa, obs_times, Y, H, R, t0=0.0,
+                                Xa=None, random=None):
+    r"""Dual ensemble Kalman filter for the state and parameters
+
+    In the Dual-EnKF, two parallel filters are simultaneously utilized for
+    the parameters and the state variables. First, the parameters might be
+    propagated (here, kept unchanged) and then updated with available data of
+    the state. The updated parameters are then used to integrate the state
+    from the initial time to the current time. The data is then used again to
+    update the state variables.
+
+    Input
+    -----
+     - *forward_model* - (func) - Called as `forward_model(t, t_obs, X, P)`,
+       integrates every ensemble member with state X[:, e] at time t and
+       parameters P[:, e] to time t_obs and returns the states there,
+       size = [Nx x Ne].  If X is `None` the model starts from the initial
+       conditions at t0 given by the parameters.
+     - *Pa* - (ndarray) - Initial ensemble of parameters, size = [Np x Ne]
+     - *obs_times* - (list) - Observation times, size = No
+     - *Y* - (ndarray) - Observational data, column k observed at
+       obs_times[k], size = [Ny x No]
+     - *H* - (ndarray or func) - Observation operator, size = [Ny x Nx]
+     - *R* - (ndarray) - Observational error covariance, size = [Ny x Ny]
+     - *t0* - (float) - Initial time
+     - *Xa* - (ndarray) - Analysis ensemble of the state at t0, defaults to
+       `None` which starts from the initial conditions
+     - *random* - (RandomState) - Source of the observation perturbations
+
+    Output
+    ------
+     - Pa - (ndarray) - Analysis ensemble of parameters after each
+       observation time, size = [No x Np x Ne]
+     - Xa - (ndarray) - Analysis ensemble of states after each observation
+       time, size = [No x Nx x Ne]
+
+    Notation
+    --------
     # Ne : Number of ensemble members
     # Np : Number of parameters
     # Nx : Number of state variables
-    # Ny : Number of available observations 
-    # No : Number of observations in time  
-    # Nt : Final time
-    # t0 : Initial time 
-    # tc : Time at current step
-    # to : Time when observations become available 
-    # Xa0: Analysis ensemble of state variables at t0, size = [Nx x Ne]
-    # Xa : Analysis ensemble of state variables, size = [Nx x Ne]
-    # Xam: Mean of the analysis state ensemble, size = [Nx x 1] 
+    # Ny : Number of available observations
+    # No : Number of observations in time
     # Xf : Forecast ensemble of state variables, size = [Nx x Ne]
-    # Xfm: Mean of the forecast state ensemble, size = [Nx x 1]
-    # Pa : Analysis ensemble of parameters, size = [Np x Ne]
-    # Pam: Mean of the analysis parameter ensemble, size = [Np x 1]
+    # Xa : Analysis ensemble of state variables, size = [Nx x Ne]
     # Pf : Forecast ensemble of parameters, size = [Np x Ne]
-    # Pfm: Mean of the forecast parameter ensemble, size = [Np x 1]
-    # H  : Observation operator (Generally consisiting of 1s and 0s), size = [Ny x Nx]
-    # Y  : Observational data matrix (vectors of data from different times), size = [Ny x No] 
+    # Pa : Analysis ensemble of parameters, size = [Np x Ne]
     # Yc : Perturbed data ensemble at the current time, size = [Ny x Ne]
-    # R  : Observational error covariance matrix , size = [Ny x Ny]
-    # Apf: forecast anomaly of the parameters, size = [Np x Ne] 
-    # Axf: forecast anomaly of the state variables, size = [Nx x Ne]
-    # Kx : Kalman gain of the state varibles, size = [Nx x Ny]
-    # Kp : Kalman gain of the parameter variables, size = [Np x Ny]
-    # sig: Standard error for perturbing the observations, size = [Ny x 1]
+    # W  : Ensemble space analysis weights, size = [Ne x Ne]
     """
 
-    # Xa = Current state of model shape = (, num_ensembles)
-    # Xf = New state of model shape = (, num_ensembles)
-    # P* = Parameter vector
+    if random is None:
+        random = numpy.random.RandomState()
 
+    Pa = numpy.array(Pa, dtype=float)
+    Y = numpy.asarray(Y, dtype=float).reshape((-1, len(obs_times)))
+    R_factor = numpy.linalg.cholesky(numpy.atleast_2d(R))
+    num_ensembles = Pa.shape[1]
 
-
-    Xa0 = numpy.empty((1))
-    Ny = num_obs
-    Y = observations
-    Yc = current_observations
-    H = data_obs_mask
-
-    for t in obs_times:
-
-        t_current = t
+    Pa_history = []
+    Xa_history = []
+    t_current = t0
+    for (k, t_observation) in enumerate(obs_times):
 
         # ==================
         #  Parameter Filter
@@ -115,37 +143,21 @@ def dual_ensemble_Kalman_filter(num_ensembles, num_obs, obs_times, t0, tf, t_obs
 
         # 1 - Forecast (propagation) step:
         # ================================
-
-        # keep the same ensemble (no propagation altough a random walk is possible)
+        # keep the same ensemble (no propagation altough a random walk is
+        # possible) and integrate the ensemble members from the current time
+        # to the observation time
         Pf = Pa
+        Xf = forward_model(t_current, t_observation, Xa, Pf)
+        HXf = observe(H, Xf)
 
-        # Integrate the ensemble members through Shallow water model from the 
-        # current time t to observation time to.  
-        for e in xrange(num_ensembles):
-            Xf[:,e] = run_swe_model( t_current, t_observation, Xa[:,e], Pf)
+        # Get perturbed observation ensemble at the obs. time
+        Yc = Y[:, k][:, numpy.newaxis] + numpy.dot(R_factor,
+                        random.normal(size=(Y.shape[0], num_ensembles)))
 
         # 2 - Analysis (update) step:
         # ===========================
-        # Get the mean of the forecast state ensemble 
-        Xf_mean = numpy.mean(Xf)
-        # Get the mean of the forecast parameter ensemble
-        Pf_mean = numpy.mean(Pf)
-
-        # Get the forecast anomaly of the state
-        Axf = 1.0 / (numpy.sqrt(num_ensembles-1)) * (Xf - numpy.tile(Xf_mean, (1, num_ensembles)))  
-        # Get the forecast anomaly of the parameters
-        Apf = 1.0 / (numpy.sqrt(num_ensembles-1)) * (Pf - numpy.tile(Pf_mean, (1, num_ensembles)))
-
-        # Get the Kalman gain of the parameters 
-        Kp = Apf * (H * Axf).transpose() / (( H*Axf ) * ( H*Apf ).transpose() + R)
-
-        # Get perturbed observation ensemble at the obs. time  
-        Yc = Y[:,to] * numpy.ones((1,num_ensembles)) + (sigma * numpy.ones((1,num_ensembles))) * numpy.random.normal(size=(Ny,num_ensembles))
-
-        # Update every parameter memeber with Kalman type corection 
-        for e in xrange(num_ensembles):
-            Pa[:,e] = Pf[:,e] + Kp * (Yc[:,e] - H * Xf[:,e])
-
+        Pa = Pf + numpy.dot(ensemble_anomalies(Pf),
+                            analysis_weights(HXf, Yc, R_factor))
 
         # ==============
         #  State Filter
@@ -153,28 +165,55 @@ def dual_ensemble_Kalman_filter(num_ensembles, num_obs, obs_times, t0, tf, t_obs
 
         # 1 - Forecast (propagation) step:
         # ================================
-        for e in xrange(Ne):
-            # Integrate the ensemble members through Shallow water model from 
-            # time 0 t0 to observation time to.  
-            Xf[:,e] = run_swe_model(t0, to, Xa0[:,e], Pa[:,e])
-
-        # While integrating from the itial time use the updated ensemble of
-        # parameters (tsunami parameters at t0) obtained from the parameter
-        # filter ( Pa )
+        # Integrate from the initial time using the updated parameters
+        Xf = forward_model(t0, t_observation, None, Pa)
+        HXf = observe(H, Xf)
 
         # 2 - Analysis (update) step:
         # ===========================
-        Xfm = numpy.mean(Xf)
+        Xa = Xf + numpy.dot(ensemble_anomalies(Xf),
+                            analysis_weights(HXf, Yc, R_factor))
 
-        # Get the forecast anomaly of the state
-        Axf = 1.0 / numpy.sqrt(Ne - 1) * (Xf - numpy.tile(Xfm, (1,Ne)))
+        Pa_history.append(Pa)
+        Xa_history.append(Xa)
+        t_current = t_observation
 
-        # Get the Kalman gain of the parameters
-        Kx = Axf * (H * Axf).transpose() / ((H * Axf) * (H * Apf).transpose() + R)
+    return numpy.array(Pa_history), numpy.array(Xa_history)
 
-        for e in xrange(Ne):
-            Xa[:,e] = Xf[:,e] + Kx * (Yc[:,e] - H * Xf[:,e])
+
+def linear_forward_model(G):
+    r"""Toy forward model whose state at time t is G(t) P
+
+    Useful for checking the filter, with Gaussian priors and a linear model
+    the filter converges to the Kalman filter solution as Ne grows.
+    """
+
+    def forward_model(t, t_obs, X, P):
+        return numpy.dot(G(t_obs), P)
+
+    return forward_model
 
 
 if __name__ == "__main__":
-    my_func(1,1)
\ No newline at end of file
+
+    # Check the filter on a toy linear model with six "slips" observed
+    # through a random linear map at three gauges
+    random = numpy.random.RandomState(0)
+    num_ensembles = 100
+    obs_times = numpy.linspace(600.0, 3600.0, 6)
+    operators = random.normal(size=(len(obs_times), 30, 6))
+    G = lambda t: operators[numpy.searchsorted(obs_times, t)]
+    H = numpy.zeros((3, 30))
+    H[[0, 1, 2], [4, 14, 24]] = 1.0
+    R = 0.01 * numpy.eye(3)
+
+    p_true = numpy.array([2.7, 23, 0.3, 6.5, 21.5, 0.3])
+    Y = numpy.array([numpy.dot(H, numpy.dot(G(t), p_true)) for t in obs_times]).T
+    Y += numpy.sqrt(0.01) * random.normal(size=Y.shape)
+
+    Pa = 30.0 * random.uniform(size=(6, num_ensembles))
+    Pa, Xa = dual_ensemble_Kalman_filter(linear_forward_model(G), Pa,
+                                         obs_times, Y, H, R, random=random)
+    for (k, t) in enumerate(obs_times):
+        print("t = %6.0f  parameter error = %s" % (t,
+                    numpy.linalg.norm(numpy.mean(Pa[k], axis=1) - p_true)))
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""Adaptively choose the next fault slips to run with GeoClaw.
+
+Starting from the runs that have already completed, a polynomial surrogate of
+the DART gauge maxima is fit and its error is estimated in two ways:
+
+ - the leave-one-out error of the fitted surrogate, which is used as the
+   stopping criterion, and
+ - the difference between the surrogate and the next lower order surrogate
+   evaluated over a large candidate pool, which is used to decide where the
+   surrogate is least certain.
+
+The candidates with the largest indicator, spread apart from each other and
+from the existing runs, form the next batch.  The batch can either be run
+directly (see :func:`adaptive_sampling`) or written out and handed to
+run_faults.py, e.g.
+
+    python adaptive_sampling.py next 10
+    python run_faults.py adaptive_batch.txt <first run number>
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+
+import numpy
+
+import surrogate
+import design
+
+# Slip bounds (m) for the six subfaults
+slip_lower, slip_upper = design.spaces["slip"]
+
+
+def fault_output_path(run_number, base_path=None):
+    r"""Output directory of the run_faults.FaultJob with *run_number*"""
+
+    if base_path is None:
+        base_path = os.environ.get('DATA_PATH', os.getcwd())
+    return os.path.join(os.path.expanduser(base_path), "tsunami",
+                        "final-tohoku-inversion", "fault_%s_output" % run_number)
+
+
+def run_log_path():
+    return os.path.join(os.environ.get('DATA_PATH', os.getcwd()),
+                        "tohoku", "okada-fault-random", "run_log.txt")
+
+
+def load_completed_runs(log_path, gauge_ids, time_limits=None,
+                              base_path=None):
+    r"""Load the slips and gauge maxima of every completed run in *log_path*
+
+    Runs listed in the log whose output cannot be read yet are skipped.  Also
+    returns the run number the next batch should start from.  *base_path* is
+    the `DATA_PATH` the runs were made with, defaults to the environment.
+    """
+
+    log = numpy.loadtxt(log_path, ndmin=2)
+    next_run_number = int(numpy.max(log[:, 0])) + 1 if log.size > 0 else 0
+    slips = []
+    qois = []
+    for row in log:
+        try:
+            output_path = fault_output_path(int(row[0]), base_path)
+            qois.append(surrogate.load_gauge_maxima(output_path, gauge_ids,
+                                                    time_limits=time_limits))
+        except (IOError, OSError, ValueError):
+            continue
+        slips.append(row[1:])
+
+    slips = numpy.array(slips).reshape((-1, len(slip_lower)))
+    qois = numpy.array(qois).reshape((-1, len(gauge_ids)))
+    return slips, qois, next_run_number
+
+
+def choose_order(num_samples, num_dim, max_order):
+    r"""Highest order <= *max_order* that can be fit with *num_samples*
+
+    A fit needs more samples than basis terms, raises ValueError if there are
+    too few samples for even a linear surrogate.
+    """
+
+    order = max_order
+    while order > 1 and \
+          surrogate.total_degree_indices(num_dim, order).shape[0] \
+                                                            >= num_samples:
+        order -= 1
+    num_terms = surrogate.total_degree_indices(num_dim, order).shape[0]
+    if num_samples <= num_terms:
+        raise ValueError("Need more than %s completed runs to fit a surrogate "
+                         "in %s dimensions, have %s." % (num_terms, num_dim,
+                                                         num_samples))
+    return order
+
+
+def estimate_error(X, Y, candidates, order, lower, upper):
+    r"""Fit surrogates to (*X*, *Y*) and estimate their error
+
+    Returns the fitted surrogate, its leave-one-out RMS error per QoI and the
+    nested-level indicator at each of the *candidates*.  The indicator is the
+    largest difference over the QoIs between the order *order* and order
+    *order* - 1 surrogates, scaled by each QoI's spread.
+    """
+
+    fine = surrogate.PolynomialSurrogate(order, lower, upper).fit(X, Y)
+    coarse = surrogate.PolynomialSurrogate(order - 1, lower, upper).fit(X, Y)
+
+    scale = numpy.std(Y, axis=0)
+    scale[scale == 0.0] = 1.0
+    indicator = numpy.max(numpy.abs(fine(candidates) - coarse(candidates))
+                                                            / scale, axis=1)
+
+    return fine, fine.loo_error(), indicator
+
+
+def select_batch(candidates, indicator, X, batch_size, lower, upper):
+    r"""Greedily pick *batch_size* candidates with large *indicator*
+
+    Each candidate's indicator is weighted by its (scaled) distance to the
+    nearest existing or already selected point so the batch does not cluster
+    around a single maximum.
+    """
+
+    width = numpy.asarray(upper) - numpy.asarray(lower)
+    points = candidates / width
+    existing = numpy.atleast_2d(X) / width
+
+    distance = numpy.inf * numpy.ones(points.shape[0])
+    for point in existing:
+        distance = numpy.minimum(distance, numpy.sqrt(numpy.sum(
+                                            (points - point)**2, axis=1)))
+    selected = []
+    for n in range(min(batch_size, candidates.shape[0])):
+        index = numpy.argmax(indicator * distance)
+        selected.append(index)
+        distance = numpy.minimum(distance, numpy.sqrt(numpy.sum(
+                                    (points - points[index])**2, axis=1)))
+
+    return candidates[selected]
+
+
+def next_batch(X, Y, batch_size, max_order=3, lower=slip_lower,
+                     upper=slip_upper, num_candidates=10000, seed=None):
+    r"""Return the next batch of slips and the current error estimates"""
+
+    random = numpy.random.RandomState(seed)
+    lower = numpy.asarray(lower, dtype=float)
+    upper = numpy.asarray(upper, dtype=float)
+    candidates = lower + (upper - lower) \
+                            * random.uniform(size=(num_candidates, len(lower)))
+
+    order = choose_order(X.shape[0], X.shape[1], max_order)
+    fit, loo_error, indicator = estimate_error(X, Y, candidates, order,
+                                               lower, upper)
+    batch = select_batch(candidates, indicator, X, batch_size, lower, upper)
+
+    return batch, fit, loo_error
+
+
+def run_fault_batch(slips, first_run_number=0):
+    r"""Run GeoClaw for each row of *slips* and return the DART gauge maxima"""
+
+    import batch
+    import run_faults
+
+    jobs = [run_faults.FaultJob(slip, run_number=first_run_number + n)
+            for (n, slip) in enumerate(slips)]
+    controller = batch.BatchController(jobs)
+    controller.wait = True
+    controller.run()
+
+    gauge_ids = surrogate.dart_gauge_ids()
+    return numpy.array([surrogate.load_gauge_maxima(
+                                        surrogate.job_output_path(job),
+                                        gauge_ids) for job in jobs])
+
+
+def adaptive_sampling(X, Y, tolerance, batch_size=10, max_runs=500,
+                            run_batch=run_fault_batch, **kwargs):
+    r"""Add batches of runs until the surrogate error is below *tolerance*
+
+    *X* and *Y* are the slips and QoIs of the runs completed so far,
+    *tolerance* is the largest acceptable leave-one-out RMS error (m) over
+    the QoIs and *run_batch* is called as `run_batch(slips, first_run_number)`
+    and returns the QoIs of the new runs.  Returns the final design, QoIs and
+    fitted surrogate.
+    """
+
+    X = numpy.array(X, dtype=float)
+    Y = numpy.array(Y, dtype=float)
+    while True:
+        batch, fit, loo_error = next_batch(X, Y, batch_size, **kwargs)
+        print("Runs = %s, order = %s, max LOO error = %s"
+                                % (X.shape[0], fit.order, numpy.max(loo_error)))
+        if numpy.max(loo_error) <= tolerance or X.shape[0] >= max_runs:
+            break
+
+        batch = batch[:max_runs - X.shape[0]]
+        X = numpy.vstack((X, batch))
+        Y = numpy.vstack((Y, run_batch(batch, first_run_number=X.shape[0]
+                                                           - batch.shape[0])))
+
+    return X, Y, fit
+
+
+if __name__ == '__main__':
+
+    # Usage:
+    #   adaptive_sampling.py next [batch_size] [output]
+    #       Write the next batch for run_faults.py based on the run log
+    #   adaptive_sampling.py run design tolerance [batch_size]
+    #       Run the initial design and keep adding batches until tolerance
+    mode = sys.argv[1] if len(sys.argv) > 1 else "next"
+
+    if mode == "next":
+        batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+        output = sys.argv[3] if len(sys.argv) > 3 else "adaptive_batch.txt"
+
+        X, Y, first_run_number = load_completed_runs(run_log_path(),
+                                                surrogate.dart_gauge_ids())
+        if X.shape[0] == 0:
+            print("No completed runs in %s, run an initial design first, "
+                  "e.g. with 'adaptive_sampling.py run'." % run_log_path())
+            sys.exit(1)
+        batch, fit, loo_error = next_batch(X, Y, batch_size)
+        print("Completed runs = %s, surrogate order = %s" % (X.shape[0],
+                                                             fit.order))
+        print("LOO RMS error per gauge = %s" % loo_error)
+        numpy.savetxt(output, batch, fmt="%+.12E")
+        print("Wrote %s slips to %s, first run number %s"
+                                % (batch.shape[0], output, first_run_number))
+
+    elif mode == "run":
+        design = numpy.atleast_2d(numpy.loadtxt(sys.argv[2]))
+        tolerance = float(sys.argv[3])
+        batch_size = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+        Y = run_fault_batch(design)
+        X, Y, fit = adaptive_sampling(design, Y, tolerance,
+                                      batch_size=batch_size)
+        numpy.savetxt("adaptive_design.txt", X, fmt="%+.12E")
+        numpy.savetxt("adaptive_qois.txt", Y)
+
+    else:
+        raise ValueError("Unknown mode %s, expected 'next' or 'run'." % mode)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""Cross-validate surrogates of several orders on several run designs.
+
+For every design (a run log written by run_faults.py) and every polynomial
+order, the surrogate is scored by repeated k-fold cross-validation and the
+held-out RMS error is reported per DART gauge together with the measured wall
+clock cost of the design's runs, so cheaper designs (e.g. slip_quads_lhs.txt
+instead of slip_quads.txt) can be compared against their accuracy.  Results
+are written as a CSV table.
+
+The held-out residuals of a least squares fit do not require refitting: with
+Q from the QR factorization of the full Vandermonde matrix V and residuals r
+of the full fit, the residuals on a held-out fold S are
+
+    e_S = (I - Q_S Q_S^T)^{-1} r_S
+
+so all folds are evaluated as a batch of small dense solves.
+
+Command line usage:
+
+    python benchmark_surrogates.py output.csv run_log.txt [run_log.txt ...]
+
+Each design should have been run with its own `DATA_PATH`, the run log is then
+`$DATA_PATH/tohoku/okada-fault-random/run_log.txt` and the design is named
+after the `DATA_PATH` directory.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import csv
+import time
+
+import numpy
+
+import surrogate
+import design
+import adaptive_sampling
+
+
+def kfold_residuals(X, Y, order, lower, upper, num_folds=5, num_repeats=100,
+                       seed=None, chunk_size=256):
+    r"""Held-out residuals of an order *order* surrogate by k-fold CV
+
+    Each of the *num_repeats* repeats splits a random permutation of the
+    samples into *num_folds* folds of equal size (any remainder is left out of
+    that repeat).  Returns the held-out residuals stacked over all folds,
+    shape (num_repeats * num_folds * fold_size, num_qois).
+    """
+
+    fit = surrogate.PolynomialSurrogate(order, lower, upper)
+    V = fit.vandermonde(X)
+    Y = numpy.asarray(Y, dtype=float).reshape((V.shape[0], -1))
+
+    fold_size = V.shape[0] // num_folds
+    if V.shape[0] - fold_size <= V.shape[1]:
+        raise ValueError("Training folds have %s samples, need more than %s "
+                         "for an order %s surrogate."
+                         % (V.shape[0] - fold_size, V.shape[1], order))
+
+    Q, R = numpy.linalg.qr(V)
+    residuals = Y - numpy.dot(Q, numpy.dot(Q.T, Y))
+
+    random = numpy.random.RandomState(seed)
+    folds = numpy.vstack([random.permutation(V.shape[0])[:num_folds
+                                * fold_size].reshape((num_folds, fold_size))
+                          for n in range(num_repeats)])
+
+    identity = numpy.eye(fold_size)
+    held_out = []
+    for start in range(0, folds.shape[0], chunk_size):
+        index = folds[start:start + chunk_size]
+        Q_S = Q[index]
+        A = identity - numpy.einsum('fip,fjp->fij', Q_S, Q_S)
+        held_out.append(numpy.linalg.solve(A, residuals[index]))
+
+    return numpy.concatenate(held_out, axis=0).reshape((-1, Y.shape[1]))
+
+
+def run_wall_hours(output_path):
+    r"""Measured wall clock time (hours) of the run with output in *output_path*
+
+    The data files are written to the output directory when the run starts
+    and the gauge and frame files are last written when it ends, so the time
+    is the span of the modification times of the files there.
+    """
+
+    paths = [os.path.join(output_path, name)
+             for name in os.listdir(output_path)]
+    data_paths = [path for path in paths if path.endswith(".data")]
+    if len(data_paths) == 0:
+        raise ValueError("No data files in %s to time the run." % output_path)
+    start = min([os.path.getmtime(path) for path in data_paths])
+    end = max([os.path.getmtime(path) for path in paths])
+    return (end - start) / 3600.0
+
+
+def design_run_hours(log_path, base_path=None):
+    r"""Total measured wall clock hours of the runs in the run log *log_path*
+
+    Runs without output are not counted, see :func:`run_wall_hours`.
+    """
+
+    log = numpy.atleast_2d(numpy.loadtxt(log_path))
+    run_hours = 0.0
+    for row in log:
+        output_path = adaptive_sampling.fault_output_path(int(row[0]),
+                                                          base_path)
+        try:
+            run_hours += run_wall_hours(output_path)
+        except (IOError, OSError, ValueError):
+            continue
+    return run_hours
+
+
+def benchmark(designs, orders, gauge_ids, **kwargs):
+    r"""Score each surrogate order on each design
+
+    *designs* is a dictionary mapping a design name to its (slips, qois,
+    run_hours), where run_hours is the measured cost of the design's runs, see
+    :func:`design_run_hours`.  Returns a list of result rows, one per design,
+    order and gauge.
+    """
+
+    lower, upper = design.spaces["slip"]
+    results = []
+    for name in sorted(designs.keys()):
+        X, Y, run_hours = designs[name]
+        scale = numpy.std(Y, axis=0)
+        for order in orders:
+            start = time.time()
+            try:
+                residuals = kfold_residuals(X, Y, order, lower, upper,
+                                            **kwargs)
+            except ValueError as e:
+                print("Skipping order %s on %s: %s" % (order, name, e))
+                continue
+            cv_seconds = time.time() - start
+
+            rmse = numpy.sqrt(numpy.mean(residuals**2, axis=0))
+            for (n, gauge_id) in enumerate(gauge_ids):
+                results.append({"design": name,
+                                "order": order,
+                                "num_runs": X.shape[0],
+                                "num_terms": surrogate.total_degree_indices(
+                                                    X.shape[1], order).shape[0],
+                                "gauge": gauge_id,
+                                "cv_rmse": rmse[n],
+                                "cv_relative": rmse[n] / scale[n]
+                                               if scale[n] > 0.0 else 0.0,
+                                "run_hours": run_hours,
+                                "cv_seconds": cv_seconds})
+
+    return results
+
+
+def write_results(path, results):
+    r"""Write the benchmark *results* to a CSV table at *path*"""
+
+    columns = ["design", "order", "num_runs", "num_terms", "gauge", "cv_rmse",
+               "cv_relative", "run_hours", "cv_seconds"]
+    with open(path, 'w') as results_file:
+        writer = csv.DictWriter(results_file, columns)
+        writer.writerow(dict(zip(columns, columns)))
+        for row in results:
+            writer.writerow(row)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        print("Usage: python benchmark_surrogates.py output.csv run_log.txt "
+              "[run_log.txt ...]")
+        sys.exit(1)
+
+    gauge_ids = surrogate.dart_gauge_ids()
+    designs = {}
+    for log_path in sys.argv[2:]:
+        base_path = os.path.abspath(os.path.join(os.path.dirname(log_path),
+                                                 os.pardir, os.pardir))
+        name = os.path.basename(base_path)
+        X, Y, next_run_number = adaptive_sampling.load_completed_runs(
+                                    log_path, gauge_ids, base_path=base_path)
+        run_hours = design_run_hours(log_path, base_path=base_path)
+        designs[name] = (X, Y, run_hours)
+        print("Loaded %s completed runs (%.1f hours) for design %s"
+                                            % (X.shape[0], run_hours, name))
+
+    results = benchmark(designs, [1, 2, 3, 4], gauge_ids)
+    write_results(sys.argv[1], results)
+    print("Wrote %s results to %s" % (len(results), sys.argv[1]))
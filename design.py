@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+"""Generate sample designs in the slip and friction parameter spaces.
+
+Designs are produced by generators that yield one row at a time while working
+on bounded blocks internally, so arbitrarily large designs can be written to
+disk without holding the whole sample matrix in memory.  Supported methods are
+
+ - "sobol" - Sobol' sequence (Joe-Kuo direction numbers, up to 10 dimensions),
+ - "halton" - Halton sequence,
+ - "lhs" - Latin hypercube, and
+ - "optimized-lhs" - maximin Latin hypercube chosen from several candidates.
+
+Constraints are vectorized functions taking a block of samples and returning
+a boolean mask of the rows to keep, e.g. :func:`magnitude_constraint` built
+from the Mw bounds in `slip_analysis/earthquake_parameterizations.csv`.
+
+Command line usage:
+
+    python design.py method space num_samples output [seed]
+
+where space "slip-mw" is the slip space restricted to the published Mw range.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import csv
+
+import numpy
+import scipy.spatial
+
+# Parameter spaces as (lower, upper) bounds
+#  slip - Six subfault slips (m), slip_quads.txt covers [0, 60]
+#  friction - Manning's n in the three depth regions, as in new_quad.txt
+spaces = {"slip": (numpy.zeros(6), 60.0 * numpy.ones(6)),
+          "friction": (0.005 * numpy.ones(3), 0.2 * numpy.ones(3))}
+
+parameterizations_path = os.path.join(os.path.dirname(__file__),
+                          "slip_analysis", "earthquake_parameterizations.csv")
+
+# Primitive polynomial degree s, coefficients a and initial direction numbers
+# m for dimensions 2 through 10 of the Sobol' sequence (Joe and Kuo 2008)
+_sobol_directions = [(1, 0, [1]),
+                     (2, 1, [1, 3]),
+                     (3, 1, [1, 3, 1]),
+                     (3, 2, [1, 1, 1]),
+                     (4, 1, [1, 1, 3, 3]),
+                     (4, 4, [1, 3, 5, 13]),
+                     (5, 2, [1, 1, 5, 5, 17]),
+                     (5, 4, [1, 1, 5, 5, 5]),
+                     (5, 7, [1, 1, 7, 11, 19])]
+_sobol_bits = 32
+
+_primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47]
+
+
+def _sobol_direction_numbers(num_dim):
+    r"""Return the (num_dim, bits) table of Sobol' direction numbers"""
+
+    if num_dim > len(_sobol_directions) + 1:
+        raise ValueError("Sobol' directions only available for up to %s "
+                         "dimensions." % (len(_sobol_directions) + 1))
+
+    V = numpy.empty((num_dim, _sobol_bits), dtype=numpy.uint64)
+    V[0, :] = [1 << (_sobol_bits - 1 - k) for k in range(_sobol_bits)]
+    for (j, (s, a, m)) in enumerate(_sobol_directions[:num_dim - 1], 1):
+        v = [m[k] << (_sobol_bits - 1 - k) for k in range(s)]
+        for k in range(s, _sobol_bits):
+            value = v[k - s] ^ (v[k - s] >> s)
+            for l in range(1, s):
+                if (a >> (s - 1 - l)) & 1:
+                    value ^= v[k - l]
+            v.append(value)
+        V[j, :] = v
+
+    return V
+
+
+def sobol_block(start, count, num_dim):
+    r"""Points *start*, ..., *start* + *count* - 1 of the Sobol' sequence
+
+    Points are in Gray code order, point 0 is the origin.
+    """
+
+    V = _sobol_direction_numbers(num_dim)
+    index = numpy.arange(start, start + count, dtype=numpy.uint64)
+    gray = index ^ (index >> numpy.uint64(1))
+
+    X = numpy.zeros((count, num_dim), dtype=numpy.uint64)
+    for bit in range(_sobol_bits):
+        set_bit = ((gray >> numpy.uint64(bit)) & numpy.uint64(1)).astype(bool)
+        X[set_bit, :] ^= V[:, bit]
+
+    return X.astype(float) / 2.0**_sobol_bits
+
+
+def halton_block(start, count, num_dim):
+    r"""Points *start*, ..., *start* + *count* - 1 of the Halton sequence"""
+
+    if num_dim > len(_primes):
+        raise ValueError("Halton sequence only implemented for up to %s "
+                         "dimensions." % len(_primes))
+
+    index = numpy.arange(start, start + count, dtype=numpy.int64)
+    X = numpy.zeros((count, num_dim))
+    for (j, base) in enumerate(_primes[:num_dim]):
+        n = index.copy()
+        factor = 1.0 / base
+        while numpy.any(n > 0):
+            X[:, j] += factor * (n % base)
+            n //= base
+            factor /= base
+
+    return X
+
+
+def _feistel_permutation(index, n, key):
+    r"""Apply a keyed pseudo-random permutation of [0, *n*) to *index*
+
+    A balanced Feistel network is a bijection on [0, 4^half) so cycle walking
+    (reapplying it until the value falls below *n*) gives a permutation of
+    [0, *n*) without ever storing it.
+    """
+
+    half = max(1, (int(numpy.ceil(numpy.log2(max(n, 2)))) + 1) // 2)
+    mask = numpy.uint64((1 << half) - 1)
+    keys = [numpy.uint64(k) for k in key]
+
+    def network(x):
+        left = x >> numpy.uint64(half)
+        right = x & mask
+        for k in keys:
+            mixed = (right * numpy.uint64(0x9E3779B1) + k) \
+                                                & numpy.uint64(0xFFFFFFFF)
+            mixed ^= mixed >> numpy.uint64(15)
+            mixed = (mixed * numpy.uint64(0x85EBCA6B)) \
+                                                & numpy.uint64(0xFFFFFFFF)
+            left, right = right, left ^ ((mixed >> numpy.uint64(7)) & mask)
+        return (left << numpy.uint64(half)) | right
+
+    x = network(numpy.asarray(index, dtype=numpy.uint64))
+    outside = x >= numpy.uint64(n)
+    while numpy.any(outside):
+        x[outside] = network(x[outside])
+        outside = x >= numpy.uint64(n)
+
+    return x.astype(numpy.int64)
+
+
+def _lhs_keys(num_dim, seed):
+    random = numpy.random.RandomState(seed)
+    return random.randint(0, 2**31 - 1, size=(num_dim, 4))
+
+
+def lhs_block(start, count, num_dim, num_samples, keys, random):
+    r"""Rows *start*, ..., *start* + *count* - 1 of a Latin hypercube
+
+    The strata of each dimension are permuted by :func:`_feistel_permutation`
+    with the per dimension *keys* and jittered by draws from *random*.
+    """
+
+    index = numpy.arange(start, start + count)
+    X = numpy.empty((count, num_dim))
+    for j in range(num_dim):
+        X[:, j] = _feistel_permutation(index, num_samples, keys[j])
+    return (X + random.uniform(size=X.shape)) / num_samples
+
+
+def minimum_distance(num_samples, num_dim, keys, max_points=2**16):
+    r"""Minimum pairwise distance of the stratum centers of a Latin hypercube
+
+    Nearest neighbours are found with a KD-tree, so the cost is
+    O(N log N).  For large designs only the first *max_points* rows are
+    used, since the permuted strata make any set of rows a representative
+    subsample, which keeps the time and memory needed bounded.
+    """
+
+    count = min(num_samples, max_points)
+    index = numpy.arange(count)
+    centers = numpy.array([_feistel_permutation(index, num_samples, keys[j])
+                           for j in range(num_dim)]).T + 0.5
+
+    distances = scipy.spatial.cKDTree(centers).query(centers, k=2)[0]
+    return numpy.min(distances[:, 1]) / num_samples
+
+
+def _unit_blocks(method, num_dim, num_samples, seed, block_size,
+                 num_candidates=10):
+    r"""Yield an unbounded stream of blocks of samples in [0, 1]^num_dim
+
+    For the Latin hypercube methods each group of *num_samples* rows forms a
+    complete hypercube, later groups are only needed when a constraint
+    rejects samples.
+    """
+
+    if method in ("sobol", "halton"):
+        block = sobol_block if method == "sobol" else halton_block
+        # Skip the first point (the origin)
+        start = 1
+        while True:
+            yield block(start, block_size, num_dim)
+            start += block_size
+
+    elif method in ("lhs", "optimized-lhs"):
+        random = numpy.random.RandomState(seed)
+        while True:
+            keys = _lhs_keys(num_dim, random.randint(0, 2**31 - 1))
+            if method == "optimized-lhs":
+                candidates = [keys] + [_lhs_keys(num_dim,
+                                                 random.randint(0, 2**31 - 1))
+                                       for n in range(num_candidates - 1)]
+                distances = [minimum_distance(num_samples, num_dim, candidate)
+                             for candidate in candidates]
+                keys = candidates[int(numpy.argmax(distances))]
+
+            for start in range(0, num_samples, block_size):
+                yield lhs_block(start, min(block_size, num_samples - start),
+                                num_dim, num_samples, keys, random)
+
+    else:
+        raise ValueError("Unknown design method %s." % method)
+
+
+def generate(method, num_samples, lower, upper, constraints=[], seed=None,
+             block_size=4096, **kwargs):
+    r"""Yield *num_samples* rows of a design in the box [*lower*, *upper*]
+
+    input
+    -----
+     - *method* (string) - One of "sobol", "halton", "lhs" or
+       "optimized-lhs".
+     - *num_samples* (int) - Number of rows to yield.
+     - *lower*, *upper* (numpy.ndarray) - Bounds of the parameter space.
+     - *constraints* (list) - Functions mapping a block of samples to a mask
+       of the rows that should be kept.
+     - *seed* (int) - Seed for the Latin hypercube methods.
+     - *block_size* (int) - Number of rows generated at a time.
+
+    """
+
+    lower = numpy.asarray(lower, dtype=float)
+    upper = numpy.asarray(upper, dtype=float)
+
+    count = 0
+    for block in _unit_blocks(method, lower.shape[0], num_samples, seed,
+                              block_size, **kwargs):
+        block = lower + (upper - lower) * block
+        for constraint in constraints:
+            block = block[constraint(block)]
+        for row in block[:num_samples - count]:
+            yield row
+        count += min(block.shape[0], num_samples - count)
+        if count >= num_samples:
+            break
+
+
+def write_design(path, rows, fmt="%+.12E"):
+    r"""Write each row yielded by *rows* to *path* as it is generated"""
+
+    num_rows = 0
+    with open(path, 'w') as design_file:
+        for row in rows:
+            design_file.write(" ".join([fmt % value for value in row]) + " \n")
+            num_rows += 1
+
+    return num_rows
+
+
+def unique_rows(values, decimals=10):
+    r"""Find the unique rows of the design *values*
+
+    Rows are hashed after rounding to *decimals* places so that repeated
+    points written with different round-off are also identified.  Returns
+    the unique rows in order of first appearance and the index into them of
+    every original row, so that `unique[inverse]` reproduces the full design.
+    """
+
+    values = numpy.atleast_2d(values)
+    first_index = {}
+    unique = []
+    inverse = numpy.empty(values.shape[0], dtype=int)
+    for (n, row) in enumerate(numpy.round(values, decimals)):
+        key = tuple(row)
+        if key not in first_index:
+            first_index[key] = len(unique)
+            unique.append(values[n])
+        inverse[n] = first_index[key]
+
+    return numpy.array(unique), inverse
+
+
+def write_design_map(path, inverse, first_run_number=0):
+    r"""Record which run each original design row was assigned to
+
+    Each line of *path* holds the original row index and run number.
+    """
+
+    with open(path, 'w') as map_file:
+        for (n, index) in enumerate(inverse):
+            map_file.write("%s %s\n" % (n, first_run_number + index))
+
+
+def read_parameterizations(path=parameterizations_path):
+    r"""Read the published source parameters in *path*
+
+    Returns a dictionary mapping each row label (e.g. "Mw") to a dictionary
+    of the non-empty values keyed by source column.
+    """
+
+    with open(path, 'r') as csv_file:
+        reader = csv.reader(csv_file)
+        columns = next(reader)[1:]
+        table = {}
+        for row in reader:
+            table[row[0]] = dict([(column, float(value))
+                                  for (column, value) in zip(columns, row[1:])
+                                  if value.strip() != ""])
+
+    return table
+
+
+def magnitude_bounds(path=parameterizations_path):
+    r"""Return the (minimum, maximum) Mw of the published models"""
+
+    mw = read_parameterizations(path)["Mw"]
+    return mw["Minimum Values"], mw["Maximum Values"]
+
+
+def subfault_moment_weights(fault=None):
+    r"""Seismic moment (N m) per unit slip of each subfault of *fault*
+
+    Moment is linear in slip so these weights only need to be computed once,
+    after which the moment of any number of slip vectors is a single product
+    (see :func:`moment_magnitude`).  *fault* defaults to the six subfault
+    fault of plot_slips.create_fault used by all of the slip studies.
+    """
+
+    if fault is None:
+        import plot_slips
+        fault = plot_slips.create_fault(numpy.ones(6))
+
+    import fault_arrays
+    return fault_arrays.FaultArrays.from_fault(fault).moment_weights
+
+
+def moment_magnitude(slips, moment_weights):
+    r"""Moment magnitude of each row of *slips*, shape (N, num_subfaults)
+
+    Agrees with `dtopotools.Fault.Mw` for the fault the weights came from.
+    """
+
+    with numpy.errstate(divide='ignore'):
+        return 2.0 / 3.0 * (numpy.log10(numpy.dot(slips, moment_weights))
+                                                                      - 9.05)
+
+
+def magnitude_constraint(moment_weights, bounds=None):
+    r"""Constraint keeping slips whose moment magnitude is within *bounds*
+
+    *moment_weights* are the per subfault weights from
+    :func:`subfault_moment_weights`, *bounds* defaults to
+    :func:`magnitude_bounds`.
+    """
+
+    if bounds is None:
+        bounds = magnitude_bounds()
+    moment_weights = numpy.asarray(moment_weights, dtype=float)
+
+    def constraint(slips):
+        Mw = moment_magnitude(slips, moment_weights)
+        return (Mw >= bounds[0]) & (Mw <= bounds[1])
+
+    return constraint
+
+
+def magnitude_constrained_slips(num_samples, method="sobol", bounds=None,
+                                moment_weights=None, **kwargs):
+    r"""Yield slip vectors whose Mw lies in the published range
+
+    *bounds* defaults to the range in earthquake_parameterizations.csv
+    (8.84 to 9.17), remaining arguments are passed on to :func:`generate`.
+    """
+
+    if moment_weights is None:
+        moment_weights = subfault_moment_weights()
+    lower, upper = spaces["slip"]
+    constraints = [magnitude_constraint(moment_weights, bounds)] \
+                + kwargs.pop("constraints", [])
+
+    return generate(method, num_samples, lower, upper,
+                    constraints=constraints, **kwargs)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 5:
+        print("Usage: python design.py method space num_samples output [seed]")
+        sys.exit(1)
+
+    method, space = sys.argv[1], sys.argv[2]
+    num_samples = int(sys.argv[3])
+    output = sys.argv[4]
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    if space == "slip-mw":
+        rows = magnitude_constrained_slips(num_samples, method, seed=seed)
+    else:
+        lower, upper = spaces[space]
+        rows = generate(method, num_samples, lower, upper, seed=seed)
+    num_rows = write_design(output, rows)
+    print("Wrote %s %s samples of the %s space to %s" % (num_rows, method,
+                                                         space, output))
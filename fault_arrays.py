@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""Array representation of faults for large models and slip ensembles.
+
+`dtopotools.Fault` keeps one `SubFault` object per subfault, so anything
+computed over the subfaults is a Python loop.  :class:`FaultArrays` holds the
+subfault parameters as contiguous numpy columns instead, giving vectorized
+moments, extrema and averages.  :class:`SlipEnsemble` pairs the geometry of a
+:class:`FaultArrays` with a (num_samples, num_subfaults) slip matrix without
+copying it, so the moments of every sample are a single product.
+
+A `dtopotools.Fault` is still needed to compute the seafloor deformation, use
+:func:`assign_slips` to set its slips from an array.
+
+"""
+
+from __future__ import print_function
+
+import numpy
+
+
+class FaultArrays(object):
+
+    r"""Struct-of-arrays fault, one numpy column per subfault parameter
+
+    Lengths are in meters, angles in degrees, slips in meters and *mu* in
+    Pa, as in `dtopotools.SubFault`.
+
+    """
+
+    columns = ["longitude", "latitude", "depth", "strike", "dip", "rake",
+               "slip", "length", "width", "mu"]
+
+    def __init__(self, **columns):
+
+        for name in self.columns:
+            setattr(self, name, numpy.ascontiguousarray(columns[name],
+                                                        dtype=float))
+
+
+    @classmethod
+    def from_fault(cls, fault):
+        r"""Columns of the subfaults of the `dtopotools.Fault` *fault*"""
+
+        values = numpy.array([[getattr(subfault, name) for name in cls.columns]
+                              for subfault in fault.subfaults], dtype=float)
+        values = values.reshape((-1, len(cls.columns)))
+        return cls(**dict([(name, values[:, k])
+                           for (k, name) in enumerate(cls.columns)]))
+
+
+    @property
+    def num_subfaults(self):
+        return self.slip.shape[0]
+
+
+    @property
+    def moment_weights(self):
+        r"""Seismic moment (N m) per unit slip of each subfault"""
+        return self.mu * self.length * self.width
+
+
+    def Mo(self, slips=None):
+        r"""Seismic moment (N m) of *slips*, defaults to the fault's slips
+
+        *slips* may also be a matrix with one slip vector per row, in which
+        case the moment of every row is returned.
+        """
+        if slips is None:
+            slips = self.slip
+        return numpy.dot(numpy.abs(slips), self.moment_weights)
+
+
+    def Mw(self, slips=None):
+        r"""Moment magnitude of *slips*, agrees with `dtopotools.Fault.Mw`"""
+        with numpy.errstate(divide='ignore'):
+            return 2.0 / 3.0 * (numpy.log10(self.Mo(slips)) - 9.05)
+
+
+    def slip_range(self):
+        r"""Minimum and maximum slip"""
+        return numpy.min(self.slip), numpy.max(self.slip)
+
+
+    def averages(self, names=("strike", "dip", "rake", "slip", "depth")):
+        r"""Dictionary of the mean over the subfaults of each of *names*"""
+        return dict([(name, numpy.mean(getattr(self, name)))
+                     for name in names])
+
+
+    def with_slips(self, slips):
+        r"""Ensemble of this fault with each row of *slips* as its slips"""
+        return SlipEnsemble(self, slips)
+
+
+class SlipEnsemble(object):
+
+    r"""Ensemble of slip vectors on the geometry of a :class:`FaultArrays`
+
+    *slips* has shape (num_samples, num_subfaults) and is referenced, not
+    copied, if it is already a float array.
+
+    """
+
+    def __init__(self, fault, slips):
+
+        self.fault = fault
+        self.slips = numpy.asarray(slips, dtype=float)
+        if self.slips.ndim != 2 or \
+           self.slips.shape[1] != fault.num_subfaults:
+            raise ValueError("Slips must have shape (N, %s), got %s."
+                             % (fault.num_subfaults, self.slips.shape))
+
+
+    def __len__(self):
+        return self.slips.shape[0]
+
+
+    def __getitem__(self, n):
+        r"""Fault of sample *n*, its slip column is a view into *slips*"""
+        columns = dict([(name, getattr(self.fault, name))
+                        for name in FaultArrays.columns])
+        columns["slip"] = self.slips[n]
+        return FaultArrays(**columns)
+
+
+    def Mo(self):
+        return self.fault.Mo(self.slips)
+
+
+    def Mw(self):
+        return self.fault.Mw(self.slips)
+
+
+    def slip_range(self):
+        r"""Minimum and maximum slip of each sample"""
+        return numpy.min(self.slips, axis=1), numpy.max(self.slips, axis=1)
+
+
+    def mean_slip(self):
+        return numpy.mean(self.slips, axis=1)
+
+
+def assign_slips(fault, slips):
+    r"""Set the slips of the subfaults of the `dtopotools.Fault` *fault*"""
+
+    if len(slips) != len(fault.subfaults):
+        raise ValueError("Need %s slips, got %s." % (len(fault.subfaults),
+                                                     len(slips)))
+    for (subfault, slip) in zip(fault.subfaults, slips):
+        subfault.slip = slip
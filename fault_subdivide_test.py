@@ -7,26 +7,18 @@ import matplotlib.pyplot as plt
 
 import clawpack.geoclaw.dtopotools as dtopotools
 
+import fault_arrays
+
 # Comparison Fault System
 UCSB_fault = dtopotools.UCSBFault('./UCSB_model3_subfault.txt')
 
 # Use data from the reconstruced UCSB fault to setup our fault system
 # Calculate average quantities across all subfaults
-ave_rake = 0.0
-ave_strike = 0.0
-ave_slip = 0.0
-for subfault in UCSB_fault.subfaults:
-    ave_rake += subfault.rake
-    ave_strike += subfault.strike
-    ave_slip += subfault.slip
-
-ave_rake /= len(UCSB_fault.subfaults)
-ave_strike /= len(UCSB_fault.subfaults)
-ave_slip /= len(UCSB_fault.subfaults)
+averages = fault_arrays.FaultArrays.from_fault(UCSB_fault).averages()
 print("Averages:")
-print("  Rake   = %s" % ave_rake)
-print("  Strike = %s" % ave_strike)
-print("  Slip   = %s" % ave_slip)
+print("  Rake   = %s" % averages["rake"])
+print("  Strike = %s" % averages["strike"])
+print("  Slip   = %s" % averages["slip"])
 
 # Base subfault - based on reconstruction by UCSB
 # http://www.geol.ucsb.edu/faculty/ji/big_earthquakes/2011/03/0311_v3/Honshu.html
@@ -36,7 +28,7 @@ subfault.strike = 198.0
 subfault.length = 19 * 25.0 * 1000.0
 subfault.width = 10 * 20.0 * 1000.0
 subfault.depth = 7.50520 * 1000.0
-subfault.slip = ave_slip
+subfault.slip = averages["slip"]
 subfault.rake = 90.0
 subfault.dip = 10.0
 subfault.latitude = 37.64165
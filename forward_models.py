@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""Forward models for the ensemble Kalman filter in Dual_EnKF_Tsunami_old.py
+
+A forward model is called as `forward_model(t, t_obs, X, P)` and returns the
+state of every ensemble member at *t_obs*, see
+:func:`Dual_EnKF_Tsunami_old.dual_ensemble_Kalman_filter`.  The state of a
+member is the surface elevation at each DART gauge in setrun.py.  Two
+implementations of :class:`ForwardModel` are provided:
+
+ - `geoclaw_forward_model.GeoClawForwardModel` runs GeoClaw for every member,
+   it is kept in its own module so that this one does not need GeoClaw or
+   the batch tools, and
+ - :class:`SurrogateForwardModel` evaluates a precomputed linear or
+   polynomial chaos surrogate of the gauge time series, which is fast enough
+   for real-time assimilation.  Members can be checked later against full
+   runs with :meth:`SurrogateForwardModel.verify`.
+
+"""
+
+from __future__ import print_function
+
+import abc
+
+import numpy
+
+import surrogate
+import design
+
+# Abstract base class usable with both Python 2 and 3
+_AbstractBase = abc.ABCMeta("_AbstractBase", (object,), {})
+
+
+class ForwardModel(_AbstractBase):
+
+    r"""Base class of the forward models used by the ensemble Kalman filter
+
+    Subclasses implement :meth:`__call__` returning the gauge state of every
+    member, size = [len(gauge_ids) x Ne].
+
+    """
+
+    def __init__(self, gauge_ids=None):
+
+        if gauge_ids is None:
+            gauge_ids = surrogate.dart_gauge_ids()
+        self.gauge_ids = list(gauge_ids)
+
+
+    @abc.abstractmethod
+    def __call__(self, t, t_obs, X, P):
+        r"""Gauge state of every member (columns of *P*) at *t_obs*"""
+
+
+class SurrogateForwardModel(ForwardModel):
+
+    r"""Forward model evaluating a surrogate of the gauge time series
+
+    *fit* is a fitted :class:`surrogate.PolynomialSurrogate` mapping slips to
+    the flattened gauge series, column `n * len(times) + k` holding gauge
+    `gauge_ids[n]` at `times[k]`.  An order 1 surrogate is the linear
+    (Green's function) response, higher orders are polynomial chaos
+    expansions.  The state of every member at *t_obs* is a single product
+    with the two time columns bracketing *t_obs*, so large ensembles are
+    advanced in milliseconds.
+
+    """
+
+    def __init__(self, fit, times, gauge_ids=None):
+
+        super(SurrogateForwardModel, self).__init__(gauge_ids)
+
+        self.fit = fit
+        self.times = numpy.asarray(times, dtype=float)
+
+
+    @classmethod
+    def from_runs(cls, slips, series, times, order=1, gauge_ids=None,
+                       lower=None, upper=None):
+        r"""Fit the surrogate to completed runs
+
+        *series* holds the gauge series of each run, shape
+        (N, len(gauge_ids), len(times)), see `surrogate.load_gauge_series`.
+        """
+
+        if lower is None or upper is None:
+            lower, upper = design.spaces["slip"]
+        series = numpy.asarray(series, dtype=float)
+        fit = surrogate.PolynomialSurrogate(order, lower, upper)
+        fit.fit(slips, series.reshape((series.shape[0], -1)))
+        return cls(fit, times, gauge_ids)
+
+
+    def save(self, path):
+        r"""Save the surrogate to the numpy archive at *path*"""
+        numpy.savez(path, order=self.fit.order, lower=self.fit.lower,
+                          upper=self.fit.upper,
+                          coefficients=self.fit.coefficients,
+                          times=self.times, gauge_ids=self.gauge_ids)
+
+
+    @classmethod
+    def load(cls, path):
+        r"""Load a surrogate saved with :meth:`save`"""
+        data = numpy.load(path)
+        fit = surrogate.PolynomialSurrogate(int(data['order']), data['lower'],
+                                                                data['upper'])
+        fit.coefficients = data['coefficients']
+        return cls(fit, data['times'], [int(gauge_id) for gauge_id
+                                                   in data['gauge_ids']])
+
+
+    def __call__(self, t, t_obs, X, P):
+
+        # Linear interpolation weights between the bracketing times
+        k = min(max(numpy.searchsorted(self.times, t_obs) - 1, 0),
+                len(self.times) - 2)
+        alpha = (t_obs - self.times[k]) / (self.times[k + 1] - self.times[k])
+        alpha = min(max(alpha, 0.0), 1.0)
+
+        columns = numpy.arange(len(self.gauge_ids)) * len(self.times) + k
+        values = self.fit(numpy.atleast_2d(P).T,
+                          columns=numpy.concatenate((columns, columns + 1)))
+        num_gauges = len(self.gauge_ids)
+        return ((1.0 - alpha) * values[:, :num_gauges]
+                       + alpha * values[:, num_gauges:]).T
+
+
+    def verify(self, P, t_obs, members, model=None):
+        r"""Compare the surrogate to full runs of the given *members*
+
+        Runs *model* (a `geoclaw_forward_model.GeoClawForwardModel` by
+        default) for the
+        columns *members* of the parameter ensemble *P* and returns the
+        surrogate and full model states at *t_obs*.
+        """
+
+        if model is None:
+            import geoclaw_forward_model
+            model = geoclaw_forward_model.GeoClawForwardModel(self.gauge_ids)
+        P = numpy.atleast_2d(P)[:, members]
+        return self(0.0, t_obs, None, P), model(0.0, t_obs, None, P)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""GeoClaw forward model for the ensemble Kalman filter
+
+:class:`GeoClawForwardModel` runs GeoClaw for every ensemble member, using
+checkpoint-restart to only integrate over each assimilation cycle.  See
+`forward_models` for the forward model protocol and the surrogate forward
+model, which do not need GeoClaw.
+
+"""
+
+from __future__ import print_function
+
+import os
+import glob
+
+import numpy
+
+import batch
+
+import run_faults
+import surrogate
+import forward_models
+
+
+class EnsembleMemberJob(run_faults.FaultJob):
+
+    r"""GeoClaw run of one ensemble member from *t_start* to *t_end*
+
+    The run writes a checkpoint at *t_end*.  If *restart_file* is given the
+    run is restarted from that checkpoint instead of from the initial
+    conditions.  *run_number* numbers the runs of the ensemble so that each
+    run keeps its own output directory and checkpoint.
+
+    """
+
+    # Output times and tfinal are set per assimilation cycle below
+    output_profiles = ("full",)
+
+    def __init__(self, slips, member, run_number, t_start, t_end,
+                       restart_file=None):
+
+        super(EnsembleMemberJob, self).__init__(slips, run_number=run_number)
+
+        self.member = member
+        self.t_start = t_start
+        self.t_end = t_end
+        self.restart_file = restart_file
+
+        self.name = "enkf-ensemble"
+        self.prefix = "member_%s_run_%s" % (member, run_number)
+
+        clawdata = self.rundata.clawdata
+
+        # Only output at the end of the cycle, gauges give the state
+        clawdata.output_style = 1
+        clawdata.num_output_times = 1
+        clawdata.tfinal = t_end
+        clawdata.output_t0 = False
+
+        # Checkpoint only at tfinal
+        clawdata.checkpt_style = 1
+
+        if restart_file is not None:
+            clawdata.restart = True
+            clawdata.restart_file = restart_file
+
+
+    def __str__(self):
+        output = super(EnsembleMemberJob, self).__str__()
+        output += "  Cycle: %s -> %s" % (self.t_start, self.t_end)
+        if self.restart_file is not None:
+            output += " (restart from %s)" % self.restart_file
+        output += "\n"
+        return output
+
+
+def latest_checkpoint(output_path):
+    r"""Path to the most recently written checkpoint in *output_path*"""
+
+    checkpoints = glob.glob(os.path.join(output_path, "fort.chk*"))
+    if len(checkpoints) == 0:
+        raise IOError("No checkpoint found in %s." % output_path)
+    return max(checkpoints, key=os.path.getmtime)
+
+
+class GeoClawForwardModel(forward_models.ForwardModel):
+
+    r"""Checkpoint-restart GeoClaw forward model for the ensemble members
+
+    Every member run checkpoints at the observation time it was run to.  When
+    a member is asked for its state at *t_obs* the latest checkpoint written
+    with the same slips is used to restart the run, so advancing an ensemble
+    from one observation time to the next only integrates over that cycle
+    rather than from t0.  Members whose slips changed in the analysis have no
+    matching checkpoint and are run from t0.
+
+    Note that GeoClaw continues a member's own trajectory on restart, the
+    analysis update of the state ensemble is not written back into the
+    checkpoints.
+
+    All members needing a run in a call are submitted together to a
+    `batch.BatchController`, which runs them in parallel.
+
+    """
+
+    def __init__(self, gauge_ids=None, t0=0.0, base_path=None):
+
+        super(GeoClawForwardModel, self).__init__(gauge_ids)
+
+        self.t0 = t0
+        self.base_path = base_path
+
+        # Per member list of (time, slips, checkpoint path, state)
+        self.checkpoints = {}
+        self.num_runs = 0
+        self.simulated_time = 0.0
+
+
+    def _find_checkpoint(self, member, slips, t_obs):
+        r"""Latest checkpoint of *member* at or before *t_obs* with *slips*"""
+
+        best = None
+        for checkpoint in self.checkpoints.get(member, []):
+            if checkpoint[0] <= t_obs and numpy.allclose(checkpoint[1], slips):
+                if best is None or checkpoint[0] > best[0]:
+                    best = checkpoint
+        return best
+
+
+    def __call__(self, t, t_obs, X, P):
+
+        P = numpy.atleast_2d(P)
+        states = numpy.empty((len(self.gauge_ids), P.shape[1]))
+
+        jobs = []
+        for member in range(P.shape[1]):
+            checkpoint = self._find_checkpoint(member, P[:, member], t_obs)
+            if checkpoint is not None and checkpoint[0] == t_obs:
+                states[:, member] = checkpoint[3]
+            elif checkpoint is not None:
+                jobs.append(EnsembleMemberJob(P[:, member], member,
+                                              self.num_runs + len(jobs),
+                                              checkpoint[0], t_obs,
+                                              restart_file=checkpoint[2]))
+            else:
+                jobs.append(EnsembleMemberJob(P[:, member], member,
+                                              self.num_runs + len(jobs),
+                                              self.t0, t_obs))
+
+        if len(jobs) > 0:
+            controller = batch.BatchController(jobs)
+            controller.wait = True
+            controller.run()
+
+        for job in jobs:
+            output_path = surrogate.job_output_path(job, self.base_path)
+            states[:, job.member] = surrogate.load_gauge_series(output_path,
+                                                self.gauge_ids, [t_obs])[:, 0]
+            self.checkpoints.setdefault(job.member, []).append(
+                                    (t_obs, numpy.array(P[:, job.member]),
+                                     latest_checkpoint(output_path),
+                                     states[:, job.member].copy()))
+            self.num_runs += 1
+            self.simulated_time += t_obs - job.t_start
+
+        return states
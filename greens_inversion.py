@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""Green's function slip inversion against the detided DART data.
+
+One GeoClaw run is made per subfault of the six subfault fault with a unit
+(1 m) slip on that subfault only.  Since the gauge response is linear in the
+slips, the response of any slip vector is the combination of these Green's
+functions, and the slips best fitting the DART data inside the comparison
+windows of run_comparisons.time_limits solve a small non-negative,
+regularized least squares problem.  With the Green's functions cached an
+inversion takes well under a second, so gauge subsets and windows can be
+changed interactively.
+
+Command line usage:
+
+    python greens_inversion.py run
+        Run the six unit source simulations.
+    python greens_inversion.py [gauge_id ...]
+        Invert using the given gauges (defaults to those in run_comparisons).
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+
+import numpy
+import scipy.optimize
+
+import batch
+
+import run_faults
+import run_comparisons
+import surrogate
+
+num_subfaults = 6
+
+# Times (s) the Green's functions are stored at
+greens_times = numpy.arange(0.0, 16.0 * 3600.0 + 1.0, 30.0)
+
+
+class UnitSourceJob(run_faults.FaultJob):
+
+    r"""Run with a unit slip on *subfault* and no slip elsewhere"""
+
+    # The Green's functions need the whole 16 h records, see greens_times
+    output_profiles = ("full",)
+
+    def __init__(self, subfault):
+
+        slips = numpy.zeros(num_subfaults)
+        slips[subfault] = 1.0
+
+        super(UnitSourceJob, self).__init__(slips, run_number=subfault)
+
+        self.name = "greens-functions"
+        self.prefix = "unit_%s" % subfault
+
+
+def load_greens_functions(gauge_ids, times=greens_times,
+                          cache_path="greens_functions.npz", base_path=None):
+    r"""Green's functions of the unit source runs at each gauge
+
+    Returns an array of shape (len(gauge_ids), len(times), num_subfaults).
+    The responses at all of the gauges in setrun.py are cached at
+    *cache_path* so later calls with any subset of gauges only read the
+    cache.
+    """
+
+    cache = None
+    if cache_path is not None and os.path.exists(cache_path):
+        cache = numpy.load(cache_path)
+        if not numpy.array_equal(cache['times'], times) or \
+           not set(gauge_ids).issubset(cache['gauge_ids']):
+            cache = None
+
+    if cache is None:
+        all_gauge_ids = surrogate.dart_gauge_ids()
+        G = numpy.empty((len(all_gauge_ids), len(times), num_subfaults))
+        for subfault in range(num_subfaults):
+            output_path = surrogate.job_output_path(UnitSourceJob(subfault),
+                                                    base_path)
+            G[:, :, subfault] = surrogate.load_gauge_series(output_path,
+                                                        all_gauge_ids, times)
+        cache = {"G": G, "gauge_ids": numpy.array(all_gauge_ids),
+                 "times": times}
+        if cache_path is not None:
+            numpy.savez(cache_path, **cache)
+
+    rows = [list(cache['gauge_ids']).index(gauge_id) for gauge_id in gauge_ids]
+    return cache['G'][rows]
+
+
+def observation_system(G, times, dart_gauges, gauge_ids,
+                       time_limits=run_comparisons.time_limits,
+                       offsets=run_comparisons.offsets):
+    r"""Least squares system A s = b matching the DART data
+
+    *G* holds the Green's functions of the gauges in *gauge_ids* (see
+    :func:`load_greens_functions`) and *dart_gauges* the detided (t, eta)
+    data as returned by `run_comparisons.load_dart_gauges`.  Only DART
+    samples inside each gauge's *time_limits* window are used.
+    """
+
+    A = []
+    b = []
+    for (n, gauge_id) in enumerate(gauge_ids):
+        t = dart_gauges[gauge_id][:, 0]
+        eta = dart_gauges[gauge_id][:, 1] + offsets.get(gauge_id, 0.0)
+        if gauge_id in time_limits:
+            window = (t >= time_limits[gauge_id][0]) \
+                   & (t <= time_limits[gauge_id][1])
+            t = t[window]
+            eta = eta[window]
+
+        A.append(numpy.array([numpy.interp(t, times, G[n, :, k])
+                              for k in range(G.shape[2])]).T)
+        b.append(eta)
+
+    return numpy.vstack(A), numpy.concatenate(b)
+
+
+def invert(A, b, regularization=0.0, prior=None):
+    r"""Non-negative Tikhonov regularized least squares slips
+
+    Minimizes |A s - b|^2 + *regularization* |s - *prior*|^2 subject to
+    s >= 0, *prior* defaults to zero.  Returns the slips and the residual
+    norm of the data misfit.
+    """
+
+    num_slips = A.shape[1]
+    if prior is None:
+        prior = numpy.zeros(num_slips)
+
+    if regularization > 0.0:
+        A_aug = numpy.vstack((A, numpy.sqrt(regularization)
+                                                    * numpy.eye(num_slips)))
+        b_aug = numpy.concatenate((b, numpy.sqrt(regularization) * prior))
+    else:
+        A_aug = A
+        b_aug = b
+
+    slips = scipy.optimize.nnls(A_aug, b_aug)[0]
+    return slips, numpy.linalg.norm(numpy.dot(A, slips) - b)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1].lower() == "run":
+        jobs = [UnitSourceJob(subfault) for subfault in range(num_subfaults)]
+        controller = batch.BatchController(jobs)
+        print(controller)
+        controller.run()
+        sys.exit(0)
+
+    if len(sys.argv) > 1:
+        gauge_ids = [int(gauge_id) for gauge_id in sys.argv[1:]]
+    else:
+        gauge_ids = run_comparisons.gauge_ids
+
+    dart_gauges = run_comparisons.load_dart_gauges(gauge_ids)
+    gauge_ids = [gauge_id for gauge_id in gauge_ids if gauge_id in dart_gauges]
+    G = load_greens_functions(gauge_ids)
+
+    start = time.time()
+    A, b = observation_system(G, greens_times, dart_gauges, gauge_ids)
+    slips, residual = invert(A, b)
+    print("Gauges = %s" % gauge_ids)
+    print("Slips = %s" % slips)
+    print("Residual = %s, %s data points, %s s" % (residual, b.shape[0],
+                                                   time.time() - start))
@@ -7,6 +7,8 @@ import matplotlib.pyplot as plt
 
 import clawpack.geoclaw.dtopotools as dtopotools
 
+import fault_arrays
+
 def plot_deformation(fault):
 
     x = numpy.linspace(140.5, 145, (145.0 - 140.5) / 0.05)
@@ -64,17 +66,7 @@ def create_fault(slips):
 
     # Use data from the reconstruced UCSB fault to setup our fault system
     # Calculate average quantities across all subfaults
-    ave_rake = 0.0
-    ave_strike = 0.0
-    ave_slip = 0.0
-    for subfault in UCSB_fault.subfaults:
-        ave_rake = subfault.rake
-        ave_strike = subfault.strike
-        ave_slip = subfault.slip
-
-    ave_rake /= len(UCSB_fault.subfaults)
-    ave_strike /= len(UCSB_fault.subfaults)
-    ave_slip /= len(UCSB_fault.subfaults)
+    averages = fault_arrays.FaultArrays.from_fault(UCSB_fault).averages()
 
     # Base subfault
     base_subfault = dtopotools.SubFault()
@@ -82,7 +74,7 @@ def create_fault(slips):
     base_subfault.length = 19 * 25.0 * 1000.0
     base_subfault.width = 10 * 20.0 * 1000.0
     base_subfault.depth = 7.50520 * 1000.0
-    base_subfault.slip = ave_slip
+    base_subfault.slip = averages["slip"]
     base_subfault.rake = 90.0
     base_subfault.dip = 10.0
     base_subfault.latitude = 37.64165
@@ -92,8 +84,7 @@ def create_fault(slips):
     # Create base subdivided fault
     fault = dtopotools.SubdividedPlaneFault(base_subfault, nstrike=3, ndip=2)
 
-    for (k, subfault) in enumerate(fault.subfaults):
-        subfault.slip = slips[k]
+    fault_arrays.assign_slips(fault, slips)
 
     return fault
 
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+"""Ensemble MCMC sampling of the slip posterior given the DART data.
+
+The likelihood compares the detided DART data inside the comparison windows
+of run_comparisons.time_limits with a surrogate of the gauge time series
+saved by `forward_models.SurrogateForwardModel`.  Since the surrogate is
+linear in its coefficients, the interpolation to the DART sample times is
+folded into the coefficients once so that the predictions of every walker
+are a single product with the basis evaluated at the walkers.
+
+The sampler is the affine invariant ensemble sampler of Goodman and Weare
+(2010) using the stretch move.  Each half of the walkers is updated at once
+against the other half, so one step costs two vectorized likelihood calls
+regardless of the number of walkers.  The chain can be checkpointed and
+continued, and the split R-hat and integrated autocorrelation time are
+provided as convergence diagnostics.
+
+Command line usage:
+
+    python posterior_sampling.py surrogate.npz [num_steps] [checkpoint]
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+
+import numpy
+
+import design
+import run_comparisons
+
+
+class SurrogateLikelihood(object):
+
+    r"""Gaussian log-likelihood of the DART data under a surrogate
+
+    *model* is a `forward_models.SurrogateForwardModel`, *dart_gauges* the
+    detided (t, eta) data as returned by `run_comparisons.load_dart_gauges`
+    and *sigma* the standard error (m) of a DART observation.  The prior is
+    uniform on the box [*lower*, *upper*], the slip space in design.py by
+    default.
+
+    """
+
+    def __init__(self, model, dart_gauges, sigma=0.01,
+                       time_limits=run_comparisons.time_limits,
+                       offsets=run_comparisons.offsets,
+                       lower=None, upper=None):
+
+        if lower is None or upper is None:
+            lower, upper = design.spaces["slip"]
+        self.lower = numpy.asarray(lower, dtype=float)
+        self.upper = numpy.asarray(upper, dtype=float)
+        self.sigma = sigma
+        self.fit = model.fit
+
+        # Interpolation from the surrogate columns to the DART samples,
+        # folded into the coefficients gauge by gauge
+        times = numpy.asarray(model.times)
+        num_times = times.shape[0]
+        operators = []
+        observations = []
+        self.gauge_ids = []
+        for (n, gauge_id) in enumerate(model.gauge_ids):
+            if gauge_id not in dart_gauges:
+                continue
+            t = dart_gauges[gauge_id][:, 0]
+            eta = dart_gauges[gauge_id][:, 1] + offsets.get(gauge_id, 0.0)
+            if gauge_id in time_limits:
+                window = (t >= time_limits[gauge_id][0]) \
+                       & (t <= time_limits[gauge_id][1])
+                t = t[window]
+                eta = eta[window]
+
+            t = numpy.clip(t, times[0], times[-1])
+            k = numpy.clip(numpy.searchsorted(times, t) - 1, 0, num_times - 2)
+            alpha = (t - times[k]) / (times[k + 1] - times[k])
+            columns = n * num_times + k
+            coefficients = self.fit.coefficients
+            operators.append((1.0 - alpha) * coefficients[:, columns]
+                                   + alpha * coefficients[:, columns + 1])
+            observations.append(eta)
+            self.gauge_ids.append(gauge_id)
+
+        if len(operators) == 0:
+            raise ValueError("None of the surrogate gauges have DART data.")
+
+        self.observations = numpy.concatenate(observations)
+        self.operator = numpy.hstack(operators)
+
+
+    @property
+    def num_observations(self):
+        return self.observations.shape[0]
+
+
+    def predict(self, X):
+        r"""Predicted DART observations at the slips *X* (N, num_dim)"""
+        return numpy.dot(self.fit.vandermonde(X), self.operator)
+
+
+    def __call__(self, X):
+        r"""Log-posterior (up to a constant) of each row of *X*"""
+
+        X = numpy.atleast_2d(X)
+        log_probability = numpy.empty(X.shape[0])
+        inside = numpy.all((X >= self.lower) & (X <= self.upper), axis=1)
+        log_probability[~inside] = -numpy.inf
+        if numpy.any(inside):
+            misfit = self.predict(X[inside]) - self.observations
+            log_probability[inside] = -0.5 * numpy.sum(misfit**2, axis=1) \
+                                                            / self.sigma**2
+        return log_probability
+
+
+class EnsembleSampler(object):
+
+    r"""Affine invariant ensemble sampler with the stretch move
+
+    *log_probability* maps an array of walker positions (N, num_dim) to their
+    log-probabilities and is called once per half step for half of the
+    walkers.  *a* is the scale of the stretch move.
+
+    """
+
+    def __init__(self, log_probability, num_walkers, num_dim, a=2.0,
+                       random=None):
+
+        if num_walkers < 2 * num_dim or num_walkers % 2 != 0:
+            raise ValueError("Need an even number of at least %s walkers, "
+                             "have %s." % (2 * num_dim, num_walkers))
+
+        self.log_probability = log_probability
+        self.num_walkers = num_walkers
+        self.num_dim = num_dim
+        self.a = a
+        if random is None:
+            random = numpy.random.RandomState()
+        self.random = random
+
+        self.chain = numpy.empty((0, num_walkers, num_dim))
+        self.log_probabilities = numpy.empty((0, num_walkers))
+        self.num_accepted = numpy.zeros(num_walkers, dtype=int)
+        self.run_time = 0.0
+
+
+    @property
+    def num_steps(self):
+        return self.chain.shape[0]
+
+
+    @property
+    def acceptance_fraction(self):
+        return self.num_accepted / float(max(self.num_steps, 1))
+
+
+    def walker_steps_per_second(self):
+        return self.num_steps * self.num_walkers / max(self.run_time, 1e-300)
+
+
+    def step(self, X, log_probability):
+        r"""Advance the walkers *X* one step, returns the new positions"""
+
+        X = X.copy()
+        log_probability = log_probability.copy()
+        half = self.num_walkers // 2
+        halves = (numpy.arange(half), numpy.arange(half, self.num_walkers))
+        for (active, complement) in (halves, halves[::-1]):
+            z = ((self.a - 1.0) * self.random.uniform(size=half) + 1.0)**2 \
+                                                                    / self.a
+            partners = X[complement[self.random.randint(half, size=half)]]
+            proposals = partners + z[:, numpy.newaxis] \
+                                        * (X[active] - partners)
+            proposal_probability = self.log_probability(proposals)
+
+            log_ratio = (self.num_dim - 1) * numpy.log(z) \
+                        + proposal_probability - log_probability[active]
+            accept = numpy.log(self.random.uniform(size=half)) < log_ratio
+
+            X[active[accept]] = proposals[accept]
+            log_probability[active[accept]] = proposal_probability[accept]
+            self.num_accepted[active[accept]] += 1
+
+        return X, log_probability
+
+
+    def run(self, num_steps, X0=None, checkpoint_path=None,
+                  checkpoint_interval=100):
+        r"""Run *num_steps* steps starting at *X0* or the end of the chain
+
+        If *checkpoint_path* is given the sampler is saved there every
+        *checkpoint_interval* steps and at the end of the run.
+        """
+
+        if X0 is None:
+            if self.num_steps == 0:
+                raise ValueError("Need initial walker positions X0.")
+            X = self.chain[-1]
+            log_probability = self.log_probabilities[-1]
+        else:
+            X = numpy.array(X0, dtype=float)
+            log_probability = self.log_probability(X)
+            if not numpy.all(numpy.isfinite(log_probability)):
+                raise ValueError("Initial walkers must have finite "
+                                 "log-probability.")
+
+        chain = numpy.empty((num_steps, self.num_walkers, self.num_dim))
+        log_probabilities = numpy.empty((num_steps, self.num_walkers))
+        start = self.num_steps
+        self.chain = numpy.concatenate((self.chain, chain))
+        self.log_probabilities = numpy.concatenate((self.log_probabilities,
+                                                    log_probabilities))
+
+        for n in range(num_steps):
+            tic = time.time()
+            X, log_probability = self.step(X, log_probability)
+            self.run_time += time.time() - tic
+            self.chain[start + n] = X
+            self.log_probabilities[start + n] = log_probability
+
+            if checkpoint_path is not None and \
+               ((n + 1) % checkpoint_interval == 0 or n + 1 == num_steps):
+                self.save(checkpoint_path, num_steps=start + n + 1)
+
+        return X
+
+
+    def save(self, path, num_steps=None):
+        r"""Checkpoint the chain and random state to the archive *path*"""
+
+        if num_steps is None:
+            num_steps = self.num_steps
+        state = self.random.get_state()
+        numpy.savez(path, chain=self.chain[:num_steps],
+                    log_probabilities=self.log_probabilities[:num_steps],
+                    num_accepted=self.num_accepted, run_time=self.run_time,
+                    a=self.a, random_key=state[1],
+                    random_position=state[2:4],
+                    random_gauss=state[4])
+
+
+    @classmethod
+    def load(cls, path, log_probability):
+        r"""Restore a sampler checkpointed with :meth:`save`"""
+
+        data = numpy.load(path)
+        num_walkers, num_dim = data['chain'].shape[1:]
+        sampler = cls(log_probability, num_walkers, num_dim,
+                      a=float(data['a']))
+        sampler.chain = data['chain']
+        sampler.log_probabilities = data['log_probabilities']
+        sampler.num_accepted = data['num_accepted']
+        sampler.run_time = float(data['run_time'])
+        sampler.random.set_state(("MT19937", data['random_key'],
+                                  int(data['random_position'][0]),
+                                  int(data['random_position'][1]),
+                                  float(data['random_gauss'])))
+        return sampler
+
+
+def split_rhat(chain):
+    r"""Split R-hat of each parameter treating each walker as a chain
+
+    *chain* has shape (num_steps, num_walkers, num_dim).  Values close to 1
+    indicate the walkers have mixed.
+    """
+
+    half = chain.shape[0] // 2
+    chains = numpy.concatenate((chain[:half], chain[half:2 * half]), axis=1)
+    n = chains.shape[0]
+    within = numpy.mean(numpy.var(chains, axis=0, ddof=1), axis=0)
+    between = n * numpy.var(numpy.mean(chains, axis=0), axis=0, ddof=1)
+    return numpy.sqrt(((n - 1.0) / n * within + between / n) / within)
+
+
+def autocorrelation_time(chain, c=5.0):
+    r"""Integrated autocorrelation time of each parameter
+
+    Uses the autocorrelation of the walker mean computed by FFT and the
+    automatic window of Sokal with constant *c*.
+    """
+
+    x = numpy.mean(chain, axis=1)
+    x = x - numpy.mean(x, axis=0)
+    n = x.shape[0]
+    size = 2**int(numpy.ceil(numpy.log2(2 * n)))
+    f = numpy.fft.rfft(x, n=size, axis=0)
+    acf = numpy.fft.irfft(f * numpy.conj(f), n=size, axis=0)[:n]
+    acf /= acf[0]
+
+    tau = 2.0 * numpy.cumsum(acf, axis=0) - 1.0
+    times = numpy.empty(chain.shape[2])
+    for k in range(chain.shape[2]):
+        window = numpy.arange(n) < c * tau[:, k]
+        m = numpy.argmin(window) if not numpy.all(window) else n - 1
+        times[k] = tau[m, k]
+    return times
+
+
+if __name__ == '__main__':
+
+    import forward_models
+
+    if len(sys.argv) < 2:
+        print("Usage: python posterior_sampling.py surrogate.npz "
+              "[num_steps] [checkpoint]")
+        sys.exit(1)
+
+    num_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    checkpoint_path = sys.argv[3] if len(sys.argv) > 3 \
+                                  else "posterior_chain.npz"
+
+    model = forward_models.SurrogateForwardModel.load(sys.argv[1])
+    dart_gauges = run_comparisons.load_dart_gauges(model.gauge_ids)
+    likelihood = SurrogateLikelihood(model, dart_gauges)
+
+    if os.path.exists(checkpoint_path):
+        sampler = EnsembleSampler.load(checkpoint_path, likelihood)
+        print("Continuing %s steps from %s" % (sampler.num_steps,
+                                               checkpoint_path))
+        sampler.run(num_steps, checkpoint_path=checkpoint_path)
+    else:
+        num_walkers = 64
+        sampler = EnsembleSampler(likelihood, num_walkers,
+                                  likelihood.lower.shape[0])
+        X0 = likelihood.lower + (likelihood.upper - likelihood.lower) \
+                    * sampler.random.uniform(size=(num_walkers,
+                                                   likelihood.lower.shape[0]))
+        sampler.run(num_steps, X0=X0, checkpoint_path=checkpoint_path)
+
+    samples = sampler.chain[sampler.num_steps // 2:]
+    print("Gauges = %s, %s observations" % (likelihood.gauge_ids,
+                                            likelihood.num_observations))
+    print("Steps = %s, walkers = %s, %s walker-steps/s"
+          % (sampler.num_steps, sampler.num_walkers,
+             sampler.walker_steps_per_second()))
+    print("Acceptance fraction = %s" % numpy.mean(sampler.acceptance_fraction))
+    print("Split R-hat = %s" % split_rhat(samples))
+    print("Autocorrelation time = %s" % autocorrelation_time(samples))
+    print("Posterior mean = %s" % numpy.mean(samples, axis=(0, 1)))
+    print("Posterior std = %s" % numpy.std(samples, axis=(0, 1)))
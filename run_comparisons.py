@@ -32,37 +32,70 @@ import matplotlib.pyplot as plt
 
 import batch
 
+import fault_arrays
+
 import clawpack.geoclaw.dtopotools as dtopotools
 import clawpack.pyclaw.gauges as gauges
 
 
+# DART gauges compared against and the time window used for each
+gauge_ids = [21401, 21413, 21414, 21415, 21419, 52402] # 21418
+time_limits = {}
+tfinal = 6 * 3600.0
+time_limits[21401] = [0, tfinal]
+time_limits[21413] = [0, tfinal]
+time_limits[21414] = [2 * 3600.0, tfinal]
+time_limits[21415] = [2 * 3600.0, tfinal]
+time_limits[21418] = [0, tfinal]
+time_limits[21419] = [0, 20000.0]
+time_limits[52402] = [2 * 3600.0, tfinal]
+# The far field gauges are reached after tfinal, their windows span the first
+# few hours after the arrival of the tsunami (about 7 h at 51407 off Hawaii and
+# 9.5 h at 46411 off California)
+time_limits[51407] = [6 * 3600.0, 10 * 3600.0]
+time_limits[46411] = [8 * 3600.0, 12 * 3600.0]
+
+# Offsets added to the detided DART data
+offsets = {}
+offsets[21401] = 0.0
+offsets[21413] = 0.0
+offsets[21414] = 0.0
+offsets[21415] = 0.01
+# offsets[21418] = 0.0 # Not found
+offsets[21419] = 0.0
+offsets[46411] = 0.0
+offsets[52402] = 0.0
+
+
+def load_dart_gauges(gauge_ids, dart_data_path=None):
+    r"""Load the detided DART data for each gauge in *gauge_ids*
+
+    Returns a dictionary mapping gauge ids to arrays of (t, eta) rows, gauges
+    without exactly one `*_notide.txt` file are reported and skipped.
+    """
+
+    if dart_data_path is None:
+        dart_data_path = os.path.join(os.getcwd(), "dart")
+
+    dart_gauges = {}
+    for gaugeno in gauge_ids:
+        files = glob.glob(os.path.join(dart_data_path, '%s*_notide.txt'
+                                                                    % gaugeno))
+        if len(files) != 1:
+            print("*** Warning: found %s files for gauge number %s"
+                                                       % (len(files), gaugeno))
+        try:
+            fname = files[0]
+            dart_gauges[gaugeno] = numpy.loadtxt(fname)
+        except:
+            pass
+
+    return dart_gauges
+
+
 def plot_gauge_comparisons(jobs, save=False):
     r"""Plot the gauge comparisons for all of the jobs listed"""
 
-    gauge_ids = [21401, 21413, 21414, 21415, 21419, 52402] # 21418
-    time_limits = {}
-    tfinal = 6 * 3600.0
-    time_limits[21401] = [0, tfinal]
-    time_limits[21413] = [0, tfinal]
-    time_limits[21414] = [2 * 3600.0, tfinal]
-    time_limits[21415] = [2 * 3600.0, tfinal]
-    # time_limits[21418] = [0, tfinal]
-    time_limits[21419] = [0, 20000.0]
-    time_limits[46411] = [7 * 3600.0, tfinal]
-    time_limits[52402] = [2 * 3600.0, tfinal]
-
-    offsets = {}
-    offsets[21401] = 0.0
-    offsets[21413] = 0.0
-    offsets[21414] = 0.0
-    offsets[21415] = 0.01
-    # offsets[21418] = 0.0 # Not found
-    offsets[21419] = 0.0
-    offsets[46411] = 0.0
-    offsets[52402] = 0.0
-
-    # Paths to data
-    dart_data_path = os.path.join(os.getcwd(), "dart")
     if os.environ.has_key('DATA_PATH'):
         base_path = os.environ['DATA_PATH']
     else:
@@ -77,18 +110,7 @@ def plot_gauge_comparisons(jobs, save=False):
             inv_path = os.path.join(base_path, "%s_output" % job.prefix)
 
     # Load DART gauges
-    dart_gauges = {}
-    for gaugeno in gauge_ids:
-        files = glob.glob(os.path.join(dart_data_path, '%s*_notide.txt'
-                                                                    % gaugeno))
-        if len(files) != 1:
-            print("*** Warning: found %s files for gauge number %s"
-                                                       % (len(files), gaugeno))
-        try:
-            fname = files[0]
-            dart_gauges[gaugeno] = numpy.loadtxt(fname)
-        except:
-            pass
+    dart_gauges = load_dart_gauges(gauge_ids)
 
     # Plot data
     figures = []
@@ -142,20 +164,27 @@ def plot_gauge_comparisons(jobs, save=False):
     return figures
 
 
-def create_SIFT_fault():
+# SIFT unit source slips (m)
+sift_slip = {"kiszb24": 4.66,
+             "kiszb25": 12.23,
+             "kisza26": 26.31,
+             "kiszb26": 21.27,
+             "kisza27": 22.75,
+             "kiszb27": 4.98}
 
-    # Slip definition
-    sift_slip = {"kiszb24": 4.66,
-                 "kiszb25": 12.23,
-                 "kisza26": 26.31,
-                 "kiszb26": 21.27,
-                 "kisza27": 22.75,
-                 "kiszb27": 4.98}
 
-    return dtopotools.SiftFault(sift_slip)
+def create_SIFT_fault(slip=sift_slip):
 
+    return dtopotools.SiftFault(slip)
+
+
+def create_inverted_fault(slips=None):
+    r"""Create the six subfault fault with the inverted *slips*
+
+    *slips* defaults to the offline inversion, new inversions can be made
+    with greens_inversion.py.
+    """
 
-def create_inverted_fault():
     # Create fault
     # Based on UCSB reconstruction and assumption of single subfault
     # Lengths are based on num_fault_segments * dx * m/km in each direction
@@ -188,21 +217,12 @@ def create_inverted_fault():
     # Comparison Fault System
     UCSB_fault = dtopotools.UCSBFault('./UCSB_model3_subfault.txt')
 
-    slips = [2.7, 23, 0.3, 6.5, 21.5, 0.3]
+    if slips is None:
+        slips = [2.7, 23, 0.3, 6.5, 21.5, 0.3]
 
     # Use data from the reconstruced UCSB fault to setup our fault system
     # Calculate average quantities across all subfaults
-    ave_rake = 0.0
-    ave_strike = 0.0
-    ave_slip = 0.0
-    for subfault in UCSB_fault.subfaults:
-        ave_rake = subfault.rake
-        ave_strike = subfault.strike
-        ave_slip = subfault.slip
-
-    ave_rake /= len(UCSB_fault.subfaults)
-    ave_strike /= len(UCSB_fault.subfaults)
-    ave_slip /= len(UCSB_fault.subfaults)
+    averages = fault_arrays.FaultArrays.from_fault(UCSB_fault).averages()
 
     # Base subfault
     base_subfault = dtopotools.SubFault()
@@ -210,7 +230,7 @@ def create_inverted_fault():
     base_subfault.length = 19 * 25.0 * 1000.0
     base_subfault.width = 10 * 20.0 * 1000.0
     base_subfault.depth = 7.50520 * 1000.0
-    base_subfault.slip = ave_slip
+    base_subfault.slip = averages["slip"]
     base_subfault.rake = 90.0
     base_subfault.dip = 10.0
     base_subfault.latitude = 37.64165
@@ -220,8 +240,7 @@ def create_inverted_fault():
     # Create base subdivided fault
     fault = dtopotools.SubdividedPlaneFault(base_subfault,
                                                  nstrike=3, ndip=2)
-    for (k, subfault) in enumerate(fault.subfaults):
-        subfault.slip = slips[k]
+    fault_arrays.assign_slips(fault, slips)
 
     return fault
 
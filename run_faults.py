@@ -11,6 +11,8 @@ import numpy
 import matplotlib.pyplot as plt
 
 import batch
+import design
+import fault_arrays
 
 import clawpack.geoclaw.dtopotools as dtopotools
 
@@ -52,11 +54,19 @@ class FaultJob(batch.Job):
     cmin_slip = 0.0
     cmax_slip = 120.0
 
-    def __init__(self, slips, run_number=1): 
+    # Output profiles supported, "gauges" only outputs the gauges, see
+    # setrun.set_gauges_only_output
+    output_profiles = ("full", "gauges")
+
+    def __init__(self, slips, run_number=1, output_profile="full"): 
         r"""
         Initialize a FaultJob object.
         
         See :class:`FaultJob` for full documentation
+
+        *output_profile* is one of :attr:`output_profiles`, "gauges" only
+        outputs the gauges and stops once the comparison windows of
+        `run_comparisons.time_limits` have been recorded.
         
         """ 
 
@@ -98,17 +108,7 @@ class FaultJob(batch.Job):
 
         # Use data from the reconstruced UCSB fault to setup our fault system
         # Calculate average quantities across all subfaults
-        ave_rake = 0.0
-        ave_strike = 0.0
-        ave_slip = 0.0
-        for subfault in UCSB_fault.subfaults:
-            ave_rake = subfault.rake
-            ave_strike = subfault.strike
-            ave_slip = subfault.slip
-
-        ave_rake /= len(UCSB_fault.subfaults)
-        ave_strike /= len(UCSB_fault.subfaults)
-        ave_slip /= len(UCSB_fault.subfaults)
+        averages = fault_arrays.FaultArrays.from_fault(UCSB_fault).averages()
 
         # Base subfault
         self.base_subfault = dtopotools.SubFault()
@@ -116,7 +116,7 @@ class FaultJob(batch.Job):
         self.base_subfault.length = 19 * 25.0 * 1000.0
         self.base_subfault.width = 10 * 20.0 * 1000.0
         self.base_subfault.depth = 7.50520 * 1000.0
-        self.base_subfault.slip = ave_slip
+        self.base_subfault.slip = averages["slip"]
         self.base_subfault.rake = 90.0
         self.base_subfault.dip = 10.0
         self.base_subfault.latitude = 37.64165
@@ -126,8 +126,7 @@ class FaultJob(batch.Job):
         # Create base subdivided fault
         self.fault = dtopotools.SubdividedPlaneFault(self.base_subfault, 
                                                      nstrike=3, ndip=2)
-        for (k, subfault) in enumerate(self.fault.subfaults):
-            subfault.slip = slips[k]
+        fault_arrays.assign_slips(self.fault, slips)
 
         self.type = "tsunami"
         self.name = "final-tohoku-inversion"
@@ -137,6 +136,15 @@ class FaultJob(batch.Job):
         # Data objects
         import setrun
         self.rundata = setrun.setrun()
+        if output_profile not in self.output_profiles:
+            raise ValueError("Output profile %s not supported by %s, use one "
+                             "of %s." % (output_profile, self.__class__.__name__,
+                                         self.output_profiles))
+        self.output_profile = output_profile
+        if output_profile == "gauges":
+            import run_comparisons
+            setrun.set_gauges_only_output(self.rundata,
+                                          run_comparisons.time_limits)
 
         # No variable friction for the time being
         self.rundata.friction_data.variable_friction = False
@@ -183,17 +191,23 @@ if __name__ == '__main__':
 
     # If a file is found on the command line, use that to calculate the 
     # quadrature points, otherwise calculate it given a default range
+    # An optional second argument gives the run number of the first fault,
+    # used when adding batches (see adaptive_sampling.py) to an existing log
+    first_run_number = 0
+    if len(sys.argv) > 2:
+        first_run_number = int(sys.argv[2])
     if len(sys.argv) > 1:
-        path = sys.argv[1]
-
-        # Load fault parameters
-        slips = numpy.loadtxt(path)
-        if len(slips.shape) == 1:
-            slips = [slips]
+        design_path = sys.argv[1]
     else:
-        slips = numpy.loadtxt("./random_sample.txt")
+        design_path = "./random_sample.txt"
         # slip_range = (0.0, 120.0)
         # slips = calculate_quadrature(slip_range)
+
+    # Load fault parameters and only run each distinct slip vector once, the
+    # map file records which run each row of the design corresponds to
+    slips, design_index = design.unique_rows(numpy.loadtxt(design_path))
+    print("Running %s unique slips from %s design rows"
+                                    % (slips.shape[0], design_index.shape[0]))
     
     # Create all jobs
     path = os.path.join(os.environ.get('DATA_PATH', os.getcwd()), 
@@ -206,12 +220,16 @@ if __name__ == '__main__':
     FaultJob.cmin_slip = numpy.min(slips)
     FaultJob.cmax_slip = numpy.max(slips)
 
-    with open(path, 'w') as run_log_file: 
+    with open(path, 'w' if first_run_number == 0 else 'a') as run_log_file: 
         jobs = []
-        for (n, slip) in enumerate(slips):
+        for (n, slip) in enumerate(slips, first_run_number):
             run_log_file.write("%s %s\n" % (n, ' '.join([str(x) for x in slip])))
             jobs.append(FaultJob(slip, run_number=n))
 
+    design.write_design_map(os.path.join(os.path.dirname(path), "%s_map.txt"
+                        % os.path.splitext(os.path.basename(design_path))[0]),
+                            design_index, first_run_number=first_run_number)
+
     controller = batch.BatchController(jobs)
     controller.wait = False
     controller.plot = True
@@ -6,14 +6,20 @@ import sys
 import numpy
 
 import batch
+import design
 
 class FrictionJob(batch.Job):
     r""""""
 
+    # Output profiles supported, see run_faults.FaultJob
+    output_profiles = ("full", "gauges")
+
     def __init__(self, index, values, 
                        source_path='$SRC/tohoku2011-paper1/sources/Ammon.txydz',
-                       contours=(numpy.infty,0.0,-200.0,-numpy.infty)):
-        r""""""
+                       contours=(numpy.infty,0.0,-200.0,-numpy.infty),
+                       output_profile="full"):
+        r"""*output_profile* is one of :attr:`output_profiles`, see
+        `run_faults.FaultJob`"""
 
         super(FrictionJob, self).__init__()
 
@@ -28,6 +34,15 @@ class FrictionJob(batch.Job):
         # Data objects
         import setrun
         self.rundata = setrun.setrun()
+        if output_profile not in self.output_profiles:
+            raise ValueError("Output profile %s not supported by %s, use one "
+                             "of %s." % (output_profile, self.__class__.__name__,
+                                         self.output_profiles))
+        self.output_profile = output_profile
+        if output_profile == "gauges":
+            import run_comparisons
+            setrun.set_gauges_only_output(self.rundata,
+                                          run_comparisons.time_limits)
 
         # Set variable friction
         self.rundata.friction_data.variable_friction = True
@@ -59,13 +74,21 @@ if __name__ == '__main__':
     source_path = '$SRC/tohoku2011-paper1/sources/Ammon.txydz'
     # source_path = os.path.abspath(os.path.join(os.getcwd(),'saito.xyzt'))
 
-    # Read in friction test values
-    friction_values = numpy.loadtxt(path)
+    # Read in friction test values, only running each distinct set once
+    friction_values, design_index = design.unique_rows(numpy.loadtxt(path))
 
     # Create all jobs
     jobs = []
     for n in xrange(friction_values.shape[0]):
         jobs.append(FrictionJob(n, friction_values[n,:], source_path))
+
+    # Record which run each row of the design corresponds to
+    map_path = os.path.join(os.environ.get('DATA_PATH', os.getcwd()),
+                            jobs[0].type, jobs[0].name, "%s_map.txt"
+                            % os.path.splitext(os.path.basename(path))[0])
+    if not os.path.exists(os.path.dirname(map_path)):
+        os.makedirs(os.path.dirname(map_path))
+    design.write_design_map(map_path, design_index)
     
     controller = batch.BatchController(jobs)
     print controller
@@ -9,16 +9,23 @@ subroutine setaux(mbc,mx,my,xlow,ylow,dx,dy,maux,aux)
 !        aux(2,i,j) = area ratio (capacity function -- set mcapa = 2)
 !        aux(3,i,j) = length ratio for edge
 !
+!     aux(4,i,j) = Manning's n friction coefficient
+!     aux(5,i,j) = g * n**2, the factor used by the friction source term
+!
 !
 
     use geoclaw_module, only: coordinate_system, earth_radius, deg2rad
-    use geoclaw_module, only: sea_level
+    use geoclaw_module, only: sea_level, grav
     use amr_module, only: mcapa, xupper, yupper, xlower, ylower
     
     use friction_module, only: friction_index, set_friction_field
 
     use topo_module
 
+    use topo_cache_module, only: topo_cache_level
+    use source_term_module, only: manning_factor_index
+    use topo_cache_module, only: fetch_cached_topo, store_cached_topo
+
     implicit none
 
     ! Arguments
@@ -27,8 +34,11 @@ subroutine setaux(mbc,mx,my,xlow,ylow,dx,dy,maux,aux)
     real(kind=8), intent(inout) :: aux(maux,1-mbc:mx+mbc,1-mbc:my+mbc)
     
     ! Locals
-    integer :: i,j,m, iint,jint
+    integer :: i,j,m, iint,jint, level, ioffset, joffset
     real(kind=8) :: x,y,xm,ym,xp,yp,topo_integral
+    logical :: use_cache
+    logical :: cached(1-mbc:mx+mbc,1-mbc:my+mbc)
+    logical :: integrated(1-mbc:mx+mbc,1-mbc:my+mbc)
     character(len=*), parameter :: aux_format = "(2i4,4d15.3)"
 
     ! Lat-Long coordinate system in use, check input variables
@@ -55,6 +65,20 @@ subroutine setaux(mbc,mx,my,xlow,ylow,dx,dy,maux,aux)
         end forall
     endif
 
+    ! Integrated topography of cells covered before on this level is cached,
+    ! see topo_cache_module
+    level = topo_cache_level(dx, dy)
+    use_cache = level > 0 .and. mtopofiles > 0 .and. test_topography == 0   &
+                .and. topo_finalized
+    cached = .false.
+    integrated = .false.
+    if (use_cache) then
+        ioffset = nint((xlow - xlower) / dx)
+        joffset = nint((ylow - ylower) / dy)
+        call fetch_cached_topo(level, ioffset, joffset, 1-mbc, 1-mbc,        &
+                               aux(1,:,:), cached)
+    endif
+
     ! Set bathymetry
     do j=1-mbc,my+mbc
         ym = ylow + (j - 1.d0) * dy
@@ -79,7 +103,8 @@ subroutine setaux(mbc,mx,my,xlow,ylow,dx,dy,maux,aux)
 
 
             ! Use input topography files if available
-            if (mtopofiles > 0 .and. test_topography == 0) then
+            if (mtopofiles > 0 .and. test_topography == 0                   &
+                                .and. .not. cached(i,j)) then
                 topo_integral = 0.d0
                 call cellgridintegrate(topo_integral,xm,x,xp,ym,y,yp, &
                     xlowtopo,ylowtopo,xhitopo,yhitopo,dxtopo,dytopo, &
@@ -87,10 +112,16 @@ subroutine setaux(mbc,mx,my,xlow,ylow,dx,dy,maux,aux)
                     mtopofiles,mtoposize,topowork)
 
                     aux(1,i,j) = topo_integral / (dx * dy * aux(2,i,j))
+                    integrated(i,j) = .true.
             endif
         enddo
     enddo
 
+    if (use_cache) then
+        call store_cached_topo(level, ioffset, joffset, 1-mbc, 1-mbc,        &
+                               aux(1,:,:), integrated)
+    endif
+
     ! Copy topo to ghost cells if outside physical domain
 
     do j=1-mbc,my+mbc
@@ -125,6 +156,12 @@ subroutine setaux(mbc,mx,my,xlow,ylow,dx,dy,maux,aux)
     ! Set friction field
     call set_friction_field(mx, my, mbc, maux, xlow, ylow, dx, dy, aux)
 
+    ! Precompute the friction factor so the source terms need not recompute
+    ! it every time step
+    if (maux >= manning_factor_index) then
+        aux(manning_factor_index,:,:) = grav * aux(friction_index,:,:)**2
+    endif
+
     ! Output for debugging to fort.23
     if (.false.) then
         print *,'Writing out aux arrays'
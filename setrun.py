@@ -13,6 +13,8 @@ import numpy
 import clawpack.clawutil.data as data
 import clawpack.geoclaw.data as geodata
 
+import topo_cache
+
 #------------------------------
 def setrun(claw_pkg='geoclaw'):
 #------------------------------
@@ -87,7 +89,7 @@ def setrun(claw_pkg='geoclaw'):
     clawdata.num_eqn = 3
 
     # Number of auxiliary variables in the aux array (initialized in setaux)
-    clawdata.num_aux = 4
+    clawdata.num_aux = 5
 
     # Index of aux array corresponding to capacity function, if there is one:
     clawdata.capa_index = 2
@@ -290,7 +292,7 @@ def setrun(claw_pkg='geoclaw'):
     # This must be a list of length maux, each element of which is one of:
     #   'center',  'capacity', 'xleft', or 'yleft'  (see documentation).
 
-    amrdata.aux_type = ['center','capacity','yleft','center']
+    amrdata.aux_type = ['center','capacity','yleft','center','center']
 
 
     # Flag using refinement routine flag2refine rather than richardson error
@@ -419,11 +421,13 @@ def setgeo(rundata):
     topo_data = rundata.topo_data
     # for topography, append lines of the form
     #   [topotype, minlevel, maxlevel, t1, t2, fname]
+    # Binary copies of the ASCII files are used if $TOPO_CACHE_PATH is set and
+    # they have been converted, see topo_cache.py
     topodir = os.path.expandvars('$SRC/tohoku2011-paper1/topo')
-    topo_data.topofiles.append([3, 1, 4, 0., 1.e10,
-                           os.path.join(topodir,'etopo1min139E147E34N41N.asc')])
-    topo_data.topofiles.append([3, 1, 4, 0., 1.e10,
-                            os.path.join(topodir,'etopo4min120E72W40S60N.asc')])
+    for name in ['etopo1min139E147E34N41N.asc', 'etopo4min120E72W40S60N.asc']:
+        topo_type, path = topo_cache.cached_topofile(
+                                        os.path.join(topodir, name), 3)
+        topo_data.topofiles.append([topo_type, 1, 4, 0., 1.e10, path])
 
 
     # == setdtopo.data values ==
@@ -468,6 +472,39 @@ def set_friction(rundata):
     return data
 
 
+def set_gauges_only_output(rundata, time_limits=None):
+    r"""Only output the gauges, e.g. for the runs of an ensemble
+
+    Turns off the q and aux output of the frames, leaving a single frame at
+    the final time.  If *time_limits*, a dictionary mapping gauge ids to
+    comparison windows (t_start, t_end), is given the run stops once every
+    gauge's window has been recorded.  Gauges without a usable window (none,
+    or one ending before it or the gauge starts) are compared over their
+    whole record, so tfinal is not reduced for them.
+    """
+
+    clawdata = rundata.clawdata
+
+    if time_limits is not None:
+        t_ends = []
+        for gauge in rundata.gaugedata.gauges:
+            window = time_limits.get(gauge[0], None)
+            if window is not None and window[1] > max(window[0], gauge[3]):
+                t_ends.append(window[1])
+            else:
+                t_ends.append(clawdata.tfinal)
+        clawdata.tfinal = max(t_ends)
+
+    clawdata.output_style = 1
+    clawdata.num_output_times = 1
+    clawdata.output_t0 = False
+    clawdata.output_q_components = 'none'
+    clawdata.output_aux_components = 'none'
+    clawdata.output_aux_onlyonce = True
+
+    return rundata
+
+
 if __name__ == '__main__':
     # Set up run-time parameters and write all data files.
     import sys
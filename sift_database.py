@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""Database of DART gauge responses to the SIFT unit sources.
+
+Each SIFT unit source is run once with a unit (1 m) slip and its gauge time
+series are stored in a single binary array of shape
+(num_units, num_gauges, num_times).  The gauge series of any SIFT slip
+dictionary, such as run_comparisons.sift_slip, is then a linear combination
+of the stored responses and can be compared against the DART data without
+any new GeoClaw runs.
+
+Command line usage:
+
+    python sift_database.py run [unit ...]
+        Run the unit source simulations.
+    python sift_database.py build [unit ...]
+        Collect the gauge output of the unit runs into the database.
+    python sift_database.py
+        Compare run_comparisons.sift_slip against the DART data.
+
+"""
+
+from __future__ import print_function
+
+import sys
+
+import numpy
+
+import batch
+
+import run_comparisons
+import surrogate
+
+# Unit sources stored by default, rows a and b around the Tohoku rupture
+default_units = ["kisz%s%s" % (row, number) for number in range(22, 30)
+                                             for row in ("a", "b")]
+
+# Times (s) the responses are stored at
+database_times = numpy.arange(0.0, 16.0 * 3600.0 + 1.0, 30.0)
+
+database_path = "sift_responses"
+
+
+class SIFTUnitSourceJob(run_comparisons.FaultJob):
+
+    r"""Run with a unit slip on the SIFT unit source *unit*"""
+
+    def __init__(self, unit):
+
+        super(SIFTUnitSourceJob, self).__init__(
+                            run_comparisons.create_SIFT_fault({unit: 1.0}),
+                            name=unit)
+
+        self.name = "sift-unit-sources"
+        self.unit = unit
+
+
+class SIFTDatabase(object):
+
+    r"""Gauge responses of SIFT unit sources
+
+    The responses are stored in `<path>.npy` and can be memory mapped, the
+    unit, gauge and time labels in `<path>_index.npz`.
+
+    """
+
+    def __init__(self, responses, units, gauge_ids, times):
+
+        self.responses = responses
+        self.units = list(units)
+        self.gauge_ids = list(gauge_ids)
+        self.times = numpy.asarray(times)
+
+
+    @classmethod
+    def build(cls, units=default_units, gauge_ids=None, times=database_times,
+                   base_path=None):
+        r"""Collect the gauge output of the unit source runs"""
+
+        if gauge_ids is None:
+            gauge_ids = surrogate.dart_gauge_ids()
+
+        responses = numpy.empty((len(units), len(gauge_ids), len(times)))
+        for (n, unit) in enumerate(units):
+            output_path = surrogate.job_output_path(SIFTUnitSourceJob(unit),
+                                                    base_path)
+            responses[n] = surrogate.load_gauge_series(output_path, gauge_ids,
+                                                       times)
+
+        return cls(responses, units, gauge_ids, times)
+
+
+    def save(self, path=database_path):
+        numpy.save(path + ".npy", self.responses)
+        numpy.savez(path + "_index.npz", units=self.units,
+                    gauge_ids=self.gauge_ids, times=self.times)
+
+
+    @classmethod
+    def load(cls, path=database_path, mmap_mode='r'):
+        index = numpy.load(path + "_index.npz")
+        responses = numpy.load(path + ".npy", mmap_mode=mmap_mode)
+        return cls(responses, [str(unit) for unit in index['units']],
+                   [int(gauge_id) for gauge_id in index['gauge_ids']],
+                   index['times'])
+
+
+    def slip_vector(self, slip):
+        r"""Slips of *slip*, a dictionary keyed by unit source, as a vector"""
+
+        missing = set(slip.keys()) - set(self.units)
+        if len(missing) > 0:
+            raise ValueError("Unit sources %s are not in the database."
+                             % ", ".join(sorted(missing)))
+        vector = numpy.zeros(len(self.units))
+        for (unit, value) in slip.items():
+            vector[self.units.index(unit)] = value
+        return vector
+
+
+    def series(self, slip):
+        r"""Gauge series of the SIFT *slip*, shape (num_gauges, num_times)"""
+
+        vector = self.slip_vector(slip)
+        active = numpy.nonzero(vector)[0]
+        return numpy.tensordot(vector[active], self.responses[active], axes=1)
+
+
+    def compare(self, slip, dart_gauges,
+                      time_limits=run_comparisons.time_limits,
+                      offsets=run_comparisons.offsets):
+        r"""RMS misfit to the DART data at each gauge in *dart_gauges*
+
+        Only gauges in the database are compared and only samples inside
+        each gauge's *time_limits* window are used.  Returns a dictionary
+        mapping gauge ids to the RMS misfit (m).
+        """
+
+        series = self.series(slip)
+        misfit = {}
+        for (gauge_id, data) in dart_gauges.items():
+            if gauge_id not in self.gauge_ids:
+                continue
+            t = data[:, 0]
+            eta = data[:, 1] + offsets.get(gauge_id, 0.0)
+            if gauge_id in time_limits:
+                window = (t >= time_limits[gauge_id][0]) \
+                       & (t <= time_limits[gauge_id][1])
+                t = t[window]
+                eta = eta[window]
+            model = numpy.interp(t, self.times,
+                                 series[self.gauge_ids.index(gauge_id)])
+            misfit[gauge_id] = numpy.sqrt(numpy.mean((model - eta)**2))
+
+        return misfit
+
+
+if __name__ == '__main__':
+
+    mode = sys.argv[1].lower() if len(sys.argv) > 1 else "compare"
+    units = sys.argv[2:] if len(sys.argv) > 2 else default_units
+
+    if mode == "run":
+        jobs = [SIFTUnitSourceJob(unit) for unit in units]
+        controller = batch.BatchController(jobs)
+        print(controller)
+        controller.run()
+
+    elif mode == "build":
+        database = SIFTDatabase.build(units)
+        database.save()
+        print("Saved responses of %s unit sources at %s gauges to %s.npy"
+                % (len(database.units), len(database.gauge_ids),
+                   database_path))
+
+    else:
+        database = SIFTDatabase.load()
+        dart_gauges = run_comparisons.load_dart_gauges(
+                                                    run_comparisons.gauge_ids)
+        misfit = database.compare(run_comparisons.sift_slip, dart_gauges)
+        for gauge_id in sorted(misfit.keys()):
+            print("Gauge %s: RMS misfit = %s m" % (gauge_id, misfit[gauge_id]))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""Seafloor deformation of the published Tohoku slip models on one grid.
+
+The final deformation of every model in `models` is computed on the shared
+grid (`grid_x`, `grid_y`) in a process pool and cached as a numpy archive in
+`dtopo_cache/`, so comparisons between models and GeoClaw runs of the whole
+catalog start from the precomputed deformation.  Cached deformations can be
+written out as type 3 dtopo files for GeoClaw with :func:`write_dtopo`.
+
+Command line usage, from this directory with the repository root on the path
+for extract_slips:
+
+    PYTHONPATH=.. python dtopo_catalog.py [model ...]
+        Build (or read from the cache) the deformations, defaults to all.
+    PYTHONPATH=.. python dtopo_catalog.py write [model ...]
+        Also write `<model>.tt3` for each model.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+import multiprocessing
+
+import numpy
+
+import clawpack.geoclaw.dtopotools as dtopotools
+
+import extract_slips
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+
+# Model name: (fault class, path of the subfault file)
+models = {"hayes": (extract_slips.HayesSubfault,
+                    os.path.join(base_path, "hayes_subfault.txt")),
+          "Shao": (dtopotools.UCSBFault,
+                   os.path.join(base_path, "Shao_et_al_subfault.txt")),
+          "Wei": (extract_slips.WeiSubfault,
+                  os.path.join(base_path, "Wei_et_al_subfault.txt")),
+          "ammon": (extract_slips.AmmonSubfault,
+                    os.path.join(base_path, "ammon_subfault.txt")),
+          "UCSB": (dtopotools.UCSBFault,
+                   os.path.join(base_path, "..", "UCSB_model3_subfault.txt"))}
+
+# Shared grid covering all of the models (2' resolution)
+grid_x = numpy.linspace(138.0, 147.0, 271)
+grid_y = numpy.linspace(33.0, 43.0, 301)
+
+cache_path = os.path.join(base_path, "dtopo_cache")
+
+
+def cache_file(name):
+    return os.path.join(cache_path, "%s.npz" % name)
+
+
+def load_cached(name, x=grid_x, y=grid_y):
+    r"""Cached deformation of model *name* on (x, y), None if not cached"""
+
+    if not os.path.exists(cache_file(name)):
+        return None
+    cache = numpy.load(cache_file(name))
+    if not (numpy.array_equal(cache['x'], x) and
+            numpy.array_equal(cache['y'], y)):
+        return None
+    return cache['dZ']
+
+
+def create_deformation(name, x=grid_x, y=grid_y):
+    r"""Compute and cache the final deformation of model *name*
+
+    Returns the model name, the deformation, shape (len(y), len(x)), and
+    the time (s) spent.  Top level so that it can be run in a process pool.
+    """
+
+    start = time.time()
+    fault_class, path = models[name]
+    fault = fault_class(path)
+    fault.rupture_type = 'static'
+    dZ = fault.create_dtopography(x, y, times=[1.0]).dZ[-1, :, :]
+
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+    numpy.savez(cache_file(name), x=x, y=y, dZ=dZ, Mw=fault.Mw())
+
+    return name, dZ, time.time() - start
+
+
+def build_catalog(names=None, processes=None):
+    r"""Deformations of the models *names* (default all) on the shared grid
+
+    Models not in the cache are computed in a pool of *processes* processes
+    (default the number of CPUs).  Returns a dictionary mapping model names
+    to deformations and one mapping them to build times (zero if cached).
+    """
+
+    if names is None:
+        names = sorted(models.keys())
+
+    deformations = {}
+    build_times = {}
+    missing = []
+    for name in names:
+        dZ = load_cached(name)
+        if dZ is None:
+            missing.append(name)
+        else:
+            deformations[name] = dZ
+            build_times[name] = 0.0
+
+    if len(missing) > 0:
+        pool = multiprocessing.Pool(processes=min(len(missing),
+                                    processes or multiprocessing.cpu_count()))
+        try:
+            for (name, dZ, build_time) in pool.imap_unordered(
+                                                create_deformation, missing):
+                deformations[name] = dZ
+                build_times[name] = build_time
+        finally:
+            pool.close()
+            pool.join()
+
+    return deformations, build_times
+
+
+def write_dtopo(name, path=None, dZ=None):
+    r"""Write the deformation of model *name* as a type 3 dtopo file"""
+
+    if dZ is None:
+        dZ = load_cached(name)
+        if dZ is None:
+            dZ = create_deformation(name)[1]
+    if path is None:
+        path = "%s.tt3" % name
+
+    dtopo = dtopotools.DTopography()
+    dtopo.x = grid_x
+    dtopo.y = grid_y
+    dtopo.X, dtopo.Y = numpy.meshgrid(grid_x, grid_y)
+    dtopo.times = numpy.array([0.0, 1.0])
+    dtopo.dZ = numpy.array([numpy.zeros(dZ.shape), dZ])
+    dtopo.write(path=path, dtopo_type=3)
+    return path
+
+
+if __name__ == '__main__':
+
+    write = len(sys.argv) > 1 and sys.argv[1].lower() == "write"
+    names = sys.argv[2:] if write else sys.argv[1:]
+    if len(names) == 0:
+        names = None
+
+    start = time.time()
+    deformations, build_times = build_catalog(names)
+    print("Built %s deformations in %s s" % (len(deformations),
+                                             time.time() - start))
+
+    for name in sorted(deformations.keys()):
+        dZ = deformations[name]
+        print("%6s: dZ(min, max) = (%s, %s), build %s s"
+                    % (name, dZ.min(), dZ.max(), build_times[name]))
+        if write:
+            print("        wrote %s" % write_dtopo(name, dZ=dZ))
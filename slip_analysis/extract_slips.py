@@ -1,26 +1,119 @@
 #!/usr/bin/env python
 
+"""Read the published Tohoku subfault models and their extreme slips.
+
+Uses the shared fault modules in the repository root (fault_arrays), which
+has to be on the Python path.  Run from this directory as
+
+    PYTHONPATH=.. python extract_slips.py
+
+"""
+
+from __future__ import print_function
+
 import re
+import os
 
 import numpy
 import matplotlib.pyplot as plt
 
 import clawpack.geoclaw.dtopotools as dtopotools
 
-class HayesSubfault(dtopotools.Fault):
-    r""""""
+import fault_arrays
+
+# Conversion factors to SI units of the units used in the subfault files
+unit_factors = {"m": 1.0, "cm": 1e-2, "km": 1e3,
+                "Pa": 1.0, "dyne/cm^2": 0.1}
+
+regexp_discretization = re.compile(r"nx[^=]*=\s*(?P<nx>\d+)\s*"
+                                   r"Dx=\s*(?P<dx>[-+0-9.eE]+)\s*km\s*"
+                                   r"ny[^=]*=\s*(?P<ny>\d+)\s*"
+                                   r"Dy=\s*(?P<dy>[-+0-9.eE]+)")
+
+
+def read_subfault_file(path, cache=True):
+    r"""Parse the finite fault subfault file at *path* in a single pass.
+
+    The files start with a commented header giving the fault segment
+    discretization (nx, Dx, ny, Dy), followed by the fault boundary and the
+    subfault table, each preceded by a commented column label.  Returns a
+    dictionary with the discretization, the boundary (5 x 3) and the
+    subfault table (num_subfaults x num_columns).
+
+    If *cache* is True the result is saved to the binary sidecar
+    `<path>.npz`, which is read instead of the text file as long as the
+    file's size and modification time are unchanged.
+    """
+
+    stat = os.stat(path)
+    sidecar_path = path + ".npz"
+    if cache and os.path.exists(sidecar_path):
+        sidecar = numpy.load(sidecar_path)
+        if int(sidecar['source_size']) == stat.st_size and \
+           float(sidecar['source_mtime']) == stat.st_mtime:
+            return dict([(key, sidecar[key]) for key in sidecar.files])
+
+    discretization = None
+    blocks = []
+    in_block = False
+    with open(path, 'r') as subfault_file:
+        for line in subfault_file:
+            if line.lstrip().startswith("#"):
+                in_block = False
+                if discretization is None:
+                    discretization = regexp_discretization.search(line)
+            elif len(line.strip()) > 0:
+                if not in_block:
+                    blocks.append([])
+                    in_block = True
+                blocks[-1].append(line)
+
+    if discretization is None or len(blocks) != 2:
+        raise ValueError("Could not find base fault characteristics in "
+                         "subfault specification file at %s." % path)
+
+    boundary = numpy.loadtxt(blocks[0], ndmin=2)
+    if boundary.shape[0] != 5 or not numpy.all(boundary[0] == boundary[4]):
+        raise ValueError("Boundary specified incomplete: %s" % boundary)
+
+    parsed = {"nx": int(discretization.group('nx')),
+              "ny": int(discretization.group('ny')),
+              "dx": float(discretization.group('dx')),
+              "dy": float(discretization.group('dy')),
+              "boundary": boundary,
+              "data": numpy.loadtxt(blocks[1], ndmin=2)}
+
+    if cache:
+        numpy.savez(sidecar_path, source_size=stat.st_size,
+                    source_mtime=stat.st_mtime, **parsed)
+
+    return parsed
+
+
+class FiniteFaultSubfault(dtopotools.Fault):
+    r"""Fault read from a finite fault subfault file.
+
+    Subclasses give the layout of the subfault table of their format in
+    *column_map*, see :func:`read_subfault_file` for the rest of the file.
+
+    """
+
+    column_map = {}
+    input_units = {"slip":"cm", "depth":"km", 'mu':"dyne/cm^2",
+                   "length":"km", "width":"km"}
+    coordinate_specification = "centroid"
 
     def __init__(self, path=None, **kwargs):
 
         self.num_cells = [None, None]
 
-        super(HayesSubfault, self).__init__()
+        super(FiniteFaultSubfault, self).__init__()
 
         if path is not None:
             self.read(path, **kwargs)
 
 
-    def read(self, path, rupture_type="static"):
+    def read(self, path, rupture_type="static", cache=True):
         r"""Read in subfault specification at *path*.
 
         Creates a list of subfaults from the subfault specification file at
@@ -33,185 +126,134 @@ class HayesSubfault(dtopotools.Fault):
 
         self.rupture_type = rupture_type
 
-        # Read header of file
-        regexp_dx = re.compile(r"Dx=[ ]*(?P<dx>[^k]*)")
-        regexp_dy = re.compile(r"Dy=[ ]*(?P<dy>[^k]*)")
-        regexp_nx = re.compile(r"nx[^=]*=[ ]*(?P<nx>[^D]*)")
-        regexp_ny = re.compile(r"ny[^=]*=[ ]*(?P<ny>[^D]*)")
-        found_subfault_discretization = False
-        found_subfault_boundary = False
-        header_lines = 0
-        with open(path, 'r') as subfault_file:
-            # Find fault secgment discretization
-            for (n,line) in enumerate(subfault_file):
-                result_dx = regexp_dx.search(line)
-                result_dy = regexp_dy.search(line)
-                result_nx = regexp_nx.search(line)
-                result_ny = regexp_ny.search(line)
-
-                if result_dx and result_dy:
-                    dx = float(result_dx.group('dx'))
-                    dy = float(result_dy.group('dy'))
-                    self.num_cells[0] = int(result_nx.group('nx'))
-                    self.num_cells[1] = int(result_ny.group('ny'))
-                    found_subfault_discretization = True
-                    break
-            header_lines += n
+        parsed = read_subfault_file(path, cache=cache)
+        self.num_cells = [int(parsed['nx']), int(parsed['ny'])]
+        self.boundary = parsed['boundary']
 
-            # Parse boundary
-            in_boundary_block = False
-            boundary_data = []
-            for (n,line) in enumerate(subfault_file):
-                if line[0].strip() == "#":
-                    if in_boundary_block and len(boundary_data) == 5:
-                        found_subfault_boundary = True
-                        break
-                else:
-                    in_boundary_block = True
-                    boundary_data.append([float(value) for value in line.split()])
+        # Convert whole columns at once, subfaults only get the values
+        columns = {"length": numpy.ones(parsed['data'].shape[0])
+                                                    * float(parsed['dx']),
+                   "width": numpy.ones(parsed['data'].shape[0])
+                                                    * float(parsed['dy'])}
+        for (name, column) in self.column_map.items():
+            columns[name] = parsed['data'][:, column]
+        for (name, units) in self.input_units.items():
+            if name in columns:
+                columns[name] = columns[name] * unit_factors[units]
 
-        # Assume that there is a column label right underneath the boundary
-        # specification
-        header_lines += n + 2
+        names = list(columns.keys())
+        values = numpy.array([columns[name] for name in names]).T
+        self.subfaults = []
+        for row in values:
+            subfault = dtopotools.SubFault()
+            subfault.coordinate_specification = self.coordinate_specification
+            for (name, value) in zip(names, row):
+                setattr(subfault, name, value)
+            self.subfaults.append(subfault)
 
-        # Check to make sure last boundary point matches, then throw away
-        if boundary_data[0] != boundary_data[4]:
-            raise ValueError("Boundary specified incomplete: ",
-                             "%s" % boundary_data)
 
+class HayesSubfault(FiniteFaultSubfault):
+    r"""Fault in the format of Hayes (2011)"""
 
-        if not (found_subfault_boundary and found_subfault_discretization):
-            raise ValueError("Could not find base fault characteristics in ",
-                             "subfault specification file at %s." % path)
+    column_map = {"latitude":0, "longitude":1, "depth":2, "slip":3,
+                   "rake":4, "strike":5, "dip":6, "rupture_time":7,
+                   "rise_time":8}#, "rise_time_ending":9, "mu":10}
 
-        # Calculate center of fault
 
-        column_map = {"latitude":0, "longitude":1, "depth":2, "slip":3,
-                       "rake":4, "strike":5, "dip":6, "rupture_time":7,
-                       "rise_time":8}#, "rise_time_ending":9, "mu":10}
-        defaults = {"length":dx, "width":dy}
-        input_units = {"slip":"cm", "depth":"km", 'mu':"dyne/cm^2",
-                                   "length":"km", "width":"km"}
+class WeiSubfault(FiniteFaultSubfault):
+    r"""Fault in the format of Wei et al (2011)"""
 
-        super(HayesSubfault, self).read(path, column_map, skiprows=header_lines,
-                                coordinate_specification="centroid",
-                                input_units=input_units, defaults=defaults)
+    column_map = {"latitude":1, "longitude":0, "depth":2, "slip":3,
+                   "rake":4, "strike":5, "dip":6}
 
 
-class WeiSubfault(dtopotools.Fault):
-    r""""""
+class AmmonSubfault(dtopotools.Fault):
+    r"""Fault given by subfault moments in the Ammon et al (2011) format
+
+    The format gives the moment of each subfault instead of its slip, the
+    slip is recovered from the subfault area and rigidity *mu* (Pa).  The
+    depths given are taken to be those of the top of each subfault.
+
+    """
 
     def __init__(self, path=None, **kwargs):
 
         self.num_cells = [None, None]
 
-        super(WeiSubfault, self).__init__()
+        super(AmmonSubfault, self).__init__()
 
         if path is not None:
             self.read(path, **kwargs)
 
 
-    def read(self, path, rupture_type="static"):
-        r"""Read in subfault specification at *path*.
-
-        Creates a list of subfaults from the subfault specification file at
-        *path*.
-
-        Subfault format contains info for dynamic rupture, so can specify 
-        rupture_type = 'static' or 'dynamic'
-
-        """
+    def read(self, path, rupture_type="static", mu=4e10):
+        r"""Read in subfault specification at *path*."""
 
         self.rupture_type = rupture_type
 
         # Read header of file
-        regexp_dx = re.compile(r"Dx=[ ]*(?P<dx>[^k]*)")
-        regexp_dy = re.compile(r"Dy=[ ]*(?P<dy>[^k]*)")
-        regexp_nx = re.compile(r"nx[^=]*=[ ]*(?P<nx>[^D]*)")
-        regexp_ny = re.compile(r"ny[^=]*=[ ]*(?P<ny>[^D]*)")
-        found_subfault_discretization = False
-        found_subfault_boundary = False
-        header_lines = 0
+        header = {}
+        regexp_value = re.compile(r"(?P<key>\w+):[ ]*(?P<value>[-+0-9.eE]+)")
         with open(path, 'r') as subfault_file:
-            # Find fault secgment discretization
-            for (n,line) in enumerate(subfault_file):
-                result_dx = regexp_dx.search(line)
-                result_dy = regexp_dy.search(line)
-                result_nx = regexp_nx.search(line)
-                result_ny = regexp_ny.search(line)
-
-                if result_dx and result_dy:
-                    dx = float(result_dx.group('dx'))
-                    dy = float(result_dy.group('dy'))
-                    self.num_cells[0] = int(result_nx.group('nx'))
-                    self.num_cells[1] = int(result_ny.group('ny'))
-                    found_subfault_discretization = True
+            for (n, line) in enumerate(subfault_file):
+                if line.startswith("Trupture"):
                     break
-            header_lines += n
-
-            # Parse boundary
-            in_boundary_block = False
-            boundary_data = []
-            for (n,line) in enumerate(subfault_file):
-                if line[0].strip() == "#":
-                    if in_boundary_block and len(boundary_data) == 5:
-                        found_subfault_boundary = True
-                        break
-                else:
-                    in_boundary_block = True
-                    boundary_data.append([float(value) for value in line.split()])
+                for result in regexp_value.finditer(line):
+                    header[result.group('key')] = float(result.group('value'))
+        header_lines = n + 1
+
+        for key in ["Strike", "Dip", "nx", "xMax", "ny", "yMax",
+                    "MomentScaleFactor"]:
+            if key not in header:
+                raise ValueError("Could not find %s in subfault specification "
+                                 "file at %s." % (key, path))
+
+        self.num_cells[0] = int(header["nx"])
+        self.num_cells[1] = int(header["ny"])
+        length = (header["xMax"] - header.get("xMin", 0.0)) * 1e3 \
+                                                            / self.num_cells[0]
+        width = (header["yMax"] - header.get("yMin", 0.0)) * 1e3 \
+                                                            / self.num_cells[1]
+
+        data = numpy.loadtxt(path, skiprows=header_lines, ndmin=2)
+        self.subfaults = []
+        for row in data:
+            subfault = dtopotools.SubFault()
+            subfault.coordinate_specification = "top center"
+            subfault.longitude = row[3]
+            subfault.latitude = row[4]
+            subfault.depth = row[5] * 1e3
+            subfault.strike = header["Strike"]
+            subfault.dip = header["Dip"]
+            subfault.rake = row[9]
+            subfault.length = length
+            subfault.width = width
+            subfault.mu = mu
+            subfault.slip = row[8] * header["MomentScaleFactor"] \
+                                            / (mu * length * width)
+            subfault.rupture_time = row[0]
+            subfault.rise_time = row[10]
+            self.subfaults.append(subfault)
 
-        # Assume that there is a column label right underneath the boundary
-        # specification
-        header_lines += n + 2
 
-        # Check to make sure last boundary point matches, then throw away
-        if boundary_data[0] != boundary_data[4]:
-            raise ValueError("Boundary specified incomplete: ",
-                             "%s" % boundary_data)
-
-
-        if not (found_subfault_boundary and found_subfault_discretization):
-            raise ValueError("Could not find base fault characteristics in ",
-                             "subfault specification file at %s." % path)
-
-        # Calculate center of fault
+def extract_extreme_slips(fault):
 
-        column_map = {"latitude":1, "longitude":0, "depth":2, "slip":3,
-                       "rake":4, "strike":5, "dip":6}
-        defaults = {"length":dx, "width":dy}
-        input_units = {"slip":"cm", "depth":"km", 'mu':"dyne/cm^2",
-                                   "length":"km", "width":"km"}
+    return fault_arrays.FaultArrays.from_fault(fault).slip_range()
 
-        super(WeiSubfault, self).read(path, column_map, skiprows=header_lines,
-                                coordinate_specification="centroid",
-                                input_units=input_units, defaults=defaults)
 
+if __name__ == '__main__':
 
-def extract_extreme_slips(fault):
+    faults = [HayesSubfault("./hayes_subfault.txt"), 
+              dtopotools.UCSBFault("./Shao_et_al_subfault.txt"), 
+              WeiSubfault("Wei_et_al_subfault.txt")]
 
     min_slip = numpy.infty
     max_slip = 0.0
-    for subfault in fault.subfaults:
-        min_slip = min(min_slip, subfault.slip)
-        max_slip = max(max_slip, subfault.slip)
-
-    return min_slip, max_slip
-
-
-faults = [HayesSubfault("./hayes_subfault.txt"), 
-          dtopotools.UCSBFault("./Shao_et_al_subfault.txt"), 
-          WeiSubfault("Wei_et_al_subfault.txt")]
-
-min_slip = numpy.infty
-max_slip = 0.0
-for [n, fault] in enumerate(faults):
-    fault_min_slip, fault_max_slip = extract_extreme_slips(fault)
-    print "Fault[%s]" % n
-    print "  slip(min, max) = (%s, %s)" % (fault_min_slip, fault_max_slip)
-    min_slip = min(min_slip, fault_min_slip)
-    max_slip = max(max_slip, fault_max_slip)
-
-print min_slip, max_slip
-
-
+    for [n, fault] in enumerate(faults):
+        fault_min_slip, fault_max_slip = extract_extreme_slips(fault)
+        print("Fault[%s]" % n)
+        print("  slip(min, max) = (%s, %s)" % (fault_min_slip, fault_max_slip))
+        min_slip = min(min_slip, fault_min_slip)
+        max_slip = max(max_slip, fault_max_slip)
+
+    print(min_slip, max_slip)
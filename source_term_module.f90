@@ -0,0 +1,87 @@
+! Data shared by the source term routines src2 and src1d
+!
+! The friction source term reads g * n**2 from aux(manning_factor_index),
+! precomputed by setaux, so the aux arrays need at least that many fields.
+!
+! The Coriolis rotation coefficients of a row only depend on its latitude and
+! the time step, so they are cached on each level's global row index space
+! and reused by every patch of the level and every later call with the same
+! time step.  A row is only recomputed when a patch covering it is advanced
+! with a different time step, rows no patch uses are never computed.
+module source_term_module
+
+    implicit none
+    save
+
+    ! aux field holding g * n**2, set in setaux
+    integer, parameter :: manning_factor_index = 5
+
+    type coriolis_rows
+        real(kind=8), allocatable :: dt(:), a11(:), a12(:)
+    end type coriolis_rows
+
+    type(coriolis_rows), allocatable :: coriolis_cache(:)
+
+contains
+
+    ! Rotation coefficients a11, a12 of the my rows of a patch with lower
+    ! edge ylow and spacing dy advanced by dt, see src2
+    subroutine coriolis_coefficients(ylow, dy, my, dt, a11, a12)
+
+        use amr_module, only: maxlv, mxnest, hyposs, ylower, yupper
+        use geoclaw_module, only: coriolis
+
+        real(kind=8), intent(in) :: ylow, dy, dt
+        integer, intent(in) :: my
+        real(kind=8), intent(out) :: a11(my), a12(my)
+
+        integer :: j, m, level, row, row_offset, num_rows
+        real(kind=8) :: y, fdt
+
+        ! Level of the patch from its grid spacing and its rows in the level
+        level = 0
+        do m=1,mxnest
+            if (abs(hyposs(m) - dy) <= 1.d-8 * dy) level = m
+        enddo
+        row_offset = nint((ylow - ylower) / dy)
+        num_rows = nint((yupper - ylower) / dy)
+        if (row_offset < 0 .or. row_offset + my > num_rows) level = 0
+
+        ! Patches not aligned with a level are computed directly
+        if (level == 0) then
+            do j=1,my
+                y = ylow + (j - 0.5d0) * dy
+                fdt = coriolis(y) * dt
+                a11(j) = 1.d0 - 0.5d0 * fdt**2 + fdt**4 / 24.d0
+                a12(j) = fdt - fdt**3 / 6.d0
+            enddo
+            return
+        endif
+
+        ! src2 is called for several patches at once by OpenMP threads
+        !$OMP CRITICAL (coriolis_cache_lock)
+        if (.not. allocated(coriolis_cache)) allocate(coriolis_cache(maxlv))
+        if (.not. allocated(coriolis_cache(level)%dt)) then
+            allocate(coriolis_cache(level)%dt(num_rows))
+            allocate(coriolis_cache(level)%a11(num_rows))
+            allocate(coriolis_cache(level)%a12(num_rows))
+            coriolis_cache(level)%dt = -1.d0
+        endif
+        do j=1,my
+            row = row_offset + j
+            if (coriolis_cache(level)%dt(row) /= dt) then
+                y = ylower + (row - 0.5d0) * dy
+                fdt = coriolis(y) * dt
+                coriolis_cache(level)%a11(row) = 1.d0 - 0.5d0 * fdt**2       &
+                                               + fdt**4 / 24.d0
+                coriolis_cache(level)%a12(row) = fdt - fdt**3 / 6.d0
+                coriolis_cache(level)%dt(row) = dt
+            endif
+            a11(j) = coriolis_cache(level)%a11(row)
+            a12(j) = coriolis_cache(level)%a12(row)
+        enddo
+        !$OMP END CRITICAL (coriolis_cache_lock)
+
+    end subroutine coriolis_coefficients
+
+end module source_term_module
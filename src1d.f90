@@ -6,11 +6,11 @@
 ! problems at the interface between coarse and fine grids.
 subroutine src1d(meqn,mbc,mx1d,q1d,maux,aux1d,t,dt)
       
-    use geoclaw_module, only: g => grav, coriolis_forcing, coriolis
+    use geoclaw_module, only: coriolis_forcing
     use geoclaw_module, only: friction_forcing, friction_depth
-    use geoclaw_module, only: omega, coordinate_system, manning_coefficient
+    use geoclaw_module, only: omega, coordinate_system
 
-    use friction_module, only: friction_index
+    use source_term_module, only: manning_factor_index
 
     implicit none
 
@@ -22,38 +22,32 @@ subroutine src1d(meqn,mbc,mx1d,q1d,maux,aux1d,t,dt)
     ! Local storage
     integer :: i
     logical :: found
-    real(kind=8) :: h, hu, hv, gamma, dgamma, y, fdt, a(2,2)
+    real(kind=8) :: h, hu, hv, gamma, dgamma, wet, shallow, fdt, a11, a12
 
     ! Algorithm parameters
     ! Parameter controls when to zero out the momentum at a depth in the
     ! friction source term
     real(kind=8), parameter :: depth_tolerance = 1.0d-30
-    
-    ! Friction forcing
-    if (friction_forcing) then
 
-        do i=1,mx1d
+    if (friction_forcing .and. maux < manning_factor_index) then
+        print *, 'ERROR in src1d: friction needs g * n**2 in aux field ',     &
+                 manning_factor_index, ', set num_aux >= ',                  &
+                 manning_factor_index, ' in setrun.py, have maux = ', maux
+        stop
+    endif
 
-            ! Extract depths
-            h = q1d(1,i)
-            hu = q1d(2,i)
-            hv = q1d(3,i)
+    ! Friction forcing, see src2
+    if (friction_forcing) then
 
-            ! If depth is near-zero, set momentum to zero
-            if (h < depth_tolerance) then
-                q1d(2:3,i) = 0.d0
-                cycle 
-            endif
-            
-            ! Apply friction source term only if in shallower water
-            if (h <= friction_depth) then
-                ! Calculate source term
-                gamma = sqrt(hu**2 + hv**2) * (g * aux1d(friction_index,i)**2) &
-                                            / h**(7.d0/3.d0)
-                dgamma = 1.d0 + dt * gamma
-                q1d(2, i) = q1d(2, i) / dgamma
-                q1d(3, i) = q1d(3, i) / dgamma
-            endif
+        do i=1,mx1d
+            h = max(q1d(1,i), depth_tolerance)
+            wet = merge(1.d0, 0.d0, q1d(1,i) >= depth_tolerance)
+            shallow = merge(1.d0, 0.d0, q1d(1,i) <= friction_depth)
+            gamma = shallow * sqrt(q1d(2,i)**2 + q1d(3,i)**2)               &
+                  * aux1d(manning_factor_index,i) / h**(7.d0 / 3.d0)
+            dgamma = wet / (1.d0 + dt * gamma)
+            q1d(2,i) = q1d(2,i) * dgamma
+            q1d(3,i) = q1d(3,i) * dgamma
         enddo
     endif
     
@@ -64,14 +58,15 @@ subroutine src1d(meqn,mbc,mx1d,q1d,maux,aux1d,t,dt)
             ! aux(3,:,:) stores the y coordinates multiplied by deg2rad
             fdt = 2.d0 * omega * sin(aux1d(3,i)) * dt
 
-            ! Calculate matrix components
-            a(1,1) = 1.d0 - 0.5d0 * fdt**2 + fdt**4 / 24.d0
-            a(1,2) =  fdt - fdt**3 / 6.d0
-            a(2,1) = -fdt + fdt**3 / 6.d0
-            a(2,2) = a(1,1)
-    
-            q1d(2,i) = q1d(2,i) * a(1,1) + q1d(3,i) * a(1,2)
-            q1d(3,i) = q1d(2,i) * a(2,1) + q1d(3,i) * a(2,2)
+            ! Rotation matrix is [a11, a12; -a12, a11], both momenta are
+            ! rotated from their values before the update
+            a11 = 1.d0 - 0.5d0 * fdt**2 + fdt**4 / 24.d0
+            a12 = fdt - fdt**3 / 6.d0
+
+            hu = q1d(2,i)
+            hv = q1d(3,i)
+            q1d(2,i) = hu * a11 + hv * a12
+            q1d(3,i) = hv * a11 - hu * a12
         enddo
     endif
 
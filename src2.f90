@@ -1,10 +1,10 @@
 subroutine src2(meqn,mbc,mx,my,xlower,ylower,dx,dy,q,maux,aux,t,dt)
       
-    use geoclaw_module, only: g => grav, coriolis_forcing, coriolis
+    use geoclaw_module, only: coriolis_forcing
     use geoclaw_module, only: friction_forcing, friction_depth
-    use geoclaw_module, only: manning_coefficient
-    
-    use friction_module, only: friction_index
+
+    use source_term_module, only: coriolis_coefficients
+    use source_term_module, only: manning_factor_index
 
     implicit none
     
@@ -18,53 +18,57 @@ subroutine src2(meqn,mbc,mx,my,xlower,ylower,dx,dy,q,maux,aux,t,dt)
 
     ! Locals
     integer :: i, j
-    real(kind=8) :: h, hu, hv, gamma, dgamma, y, fdt, a(2,2)
+    real(kind=8) :: h, hu, hv, gamma, dgamma, wet, shallow
+    real(kind=8) :: a11(my), a12(my)
 
     ! Algorithm parameters
     ! Parameter controls when to zero out the momentum at a depth in the
     ! friction source term
     real(kind=8), parameter :: depth_tolerance = 1.0d-30
 
+    if (friction_forcing .and. maux < manning_factor_index) then
+        print *, 'ERROR in src2:  friction needs g * n**2 in aux field ',     &
+                 manning_factor_index, ', set num_aux >= ',                  &
+                 manning_factor_index, ' in setrun.py, have maux = ', maux
+        stop
+    endif
+
     ! Friction source term
+    !   gamma = g n^2 |hu| / h^(7/3), with g n^2 precomputed by setaux in
+    !   aux(manning_factor_index).  The loop has no branches so that it
+    !   vectorizes: dry cells (depth below depth_tolerance) get their momentum
+    !   multiplied by 0 and cells deeper than friction_depth by 1.
     if (friction_forcing) then
         do j=1,my
             do i=1,mx
-                ! Extract appropriate momentum
-                if (q(1,i,j) < depth_tolerance) then
-                    q(2:3,i,j) = 0.d0
-                else
-                    ! Apply friction source term only if in shallower water
-                    if (q(1,i,j) <= friction_depth) then
-                        ! Calculate source term
-                        gamma = sqrt(q(2,i,j)**2 + q(3,i,j)**2) * g     &   
-                              * aux(friction_index,i,j)**2 / (q(1,i,j)**(7.d0/3.d0))
-                        dgamma = 1.d0 + dt * gamma
-                        q(2, i, j) = q(2, i, j) / dgamma
-                        q(3, i, j) = q(3, i, j) / dgamma
-                    endif
-                endif
+                h = max(q(1,i,j), depth_tolerance)
+                wet = merge(1.d0, 0.d0, q(1,i,j) >= depth_tolerance)
+                shallow = merge(1.d0, 0.d0, q(1,i,j) <= friction_depth)
+                gamma = shallow * sqrt(q(2,i,j)**2 + q(3,i,j)**2)           &
+                      * aux(manning_factor_index,i,j) / h**(7.d0 / 3.d0)
+                dgamma = wet / (1.d0 + dt * gamma)
+                q(2,i,j) = q(2,i,j) * dgamma
+                q(3,i,j) = q(3,i,j) * dgamma
             enddo
         enddo
     endif
     ! End of friction source term
 
     ! Coriolis source term
-    ! TODO: May want to remove the internal calls to coriolis as this could 
-    !       lead to slow downs.
     if (coriolis_forcing) then
-        do j=1,my
-            y = ylower + (j - 0.5d0) * dy
-            fdt = coriolis(y) * dt ! Calculate f dependent on coordinate system
 
-            ! Calculate matrix components
-            a(1,1) = 1.d0 - 0.5d0 * fdt**2 + fdt**4 / 24.d0
-            a(1,2) =  fdt - fdt**3 / 6.d0
-            a(2,1) = -fdt + fdt**3 / 6.d0
-            a(2,2) = a(1,1)
+        ! The rotation coefficients only depend on the row and dt, they are
+        ! cached per level, see source_term_module
+        call coriolis_coefficients(ylower, dy, my, dt, a11, a12)
 
+        ! Rotation matrix is [a11, a12; -a12, a11], both momenta are rotated
+        ! from their values before the update
+        do j=1,my
             do i=1,mx
-                q(2,i,j) = q(2, i, j) * a(1,1) + q(3, i, j) * a(1,2)
-                q(3,i,j) = q(2, i, j) * a(2,1) + q(3, i, j) * a(2,2)
+                hu = q(2,i,j)
+                hv = q(3,i,j)
+                q(2,i,j) = hu * a11(j) + hv * a12(j)
+                q(3,i,j) = hv * a11(j) - hu * a12(j)
             enddo
         enddo
     endif
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+"""Assimilate DART observations into the slip ensemble as they arrive.
+
+Observations are read from a stream of batches, each a list of
+(t, gauge_id, eta) tuples.  The stand-in for the live DART feed is
+:func:`tail_observations`, which follows a text file with one observation
+"t gauge_id eta" per line as it is appended to.
+
+Each batch updates the parameter ensemble with an ensemble Kalman analysis
+against the forward model's prediction of just those observations.  The
+ensemble carries everything learned from earlier batches so past cycles are
+never recomputed.  After each update the slip estimate and the ensemble mean
+gauge forecast are published and the latency of the update is reported.
+
+Command line usage:
+
+    python streaming_assimilation.py surrogate.npz observations.txt [output]
+
+where surrogate.npz was saved by `forward_models.SurrogateForwardModel`.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+
+import numpy
+
+import design
+import Dual_EnKF_Tsunami_old as enkf
+
+
+def tail_observations(path, poll_interval=1.0, timeout=None):
+    r"""Yield batches of new observations appended to the file at *path*
+
+    Every poll returns the complete lines added since the last poll as one
+    batch.  Stops after *timeout* seconds without new data if given.
+    """
+
+    with open(path, 'r') as observation_file:
+        buffer = ""
+        last_data = time.time()
+        while True:
+            buffer += observation_file.read()
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+
+            batch = []
+            for line in lines:
+                values = line.split()
+                if len(values) == 3 and not line.startswith("#"):
+                    batch.append((float(values[0]), int(values[1]),
+                                  float(values[2])))
+
+            if len(batch) > 0:
+                last_data = time.time()
+                yield batch
+            elif timeout is not None and time.time() - last_data > timeout:
+                break
+            else:
+                time.sleep(poll_interval)
+
+
+class StreamingAssimilation(object):
+
+    r"""Incremental ensemble Kalman update of the slips from DART batches
+
+    *forward_model* is a :class:`forward_models.ForwardModel`, normally the
+    surrogate one, *Pa* the prior parameter ensemble [Np x Ne] and *sigma*
+    the standard error (m) of a DART observation.
+
+    """
+
+    def __init__(self, forward_model, Pa, sigma=0.01, forecast_times=None,
+                       random=None):
+
+        self.forward_model = forward_model
+        self.Pa = numpy.array(Pa, dtype=float)
+        self.sigma = sigma
+        if forecast_times is None:
+            forecast_times = numpy.linspace(0.0, 12.0 * 3600.0, 145)
+        self.forecast_times = numpy.asarray(forecast_times)
+        if random is None:
+            random = numpy.random.RandomState()
+        self.random = random
+
+        self.num_observations = 0
+        self.latencies = []
+
+
+    def predict(self, batch):
+        r"""Ensemble prediction of the observations in *batch* [Ny x Ne]"""
+
+        gauge_index = dict([(gauge_id, n) for (n, gauge_id)
+                            in enumerate(self.forward_model.gauge_ids)])
+        HXf = numpy.empty((len(batch), self.Pa.shape[1]))
+        times = sorted(set([observation[0] for observation in batch]))
+        for t in times:
+            state = self.forward_model(0.0, t, None, self.Pa)
+            for (n, observation) in enumerate(batch):
+                if observation[0] == t:
+                    HXf[n, :] = state[gauge_index[observation[1]], :]
+        return HXf
+
+
+    def update(self, batch):
+        r"""Assimilate one batch of observations, returns the latency (s)"""
+
+        start = time.time()
+
+        batch = [observation for observation in batch
+                 if observation[1] in self.forward_model.gauge_ids]
+        if len(batch) > 0:
+            HXf = self.predict(batch)
+            y = numpy.array([observation[2] for observation in batch])
+            R_factor = self.sigma * numpy.eye(len(batch))
+            Yc = y[:, numpy.newaxis] + self.sigma \
+                            * self.random.normal(size=HXf.shape)
+
+            self.Pa = self.Pa + numpy.dot(enkf.ensemble_anomalies(self.Pa),
+                                   enkf.analysis_weights(HXf, Yc, R_factor))
+            self.num_observations += len(batch)
+
+        latency = time.time() - start
+        self.latencies.append(latency)
+        return latency
+
+
+    def slip_estimate(self):
+        r"""Ensemble mean and standard deviation of the slips"""
+        return numpy.mean(self.Pa, axis=1), numpy.std(self.Pa, axis=1, ddof=1)
+
+
+    def gauge_forecast(self):
+        r"""Ensemble mean gauge series at the forecast times
+
+        Returns an array of shape (len(gauge_ids), len(forecast_times)).
+        """
+        return numpy.array([numpy.mean(self.forward_model(0.0, t, None,
+                                                          self.Pa), axis=1)
+                            for t in self.forecast_times]).T
+
+
+    def run(self, stream, publish=None):
+        r"""Assimilate every batch from *stream*
+
+        After each update `publish(self, batch, latency)` is called if given.
+        """
+
+        for batch in stream:
+            latency = self.update(batch)
+            if publish is not None:
+                publish(self, batch, latency)
+
+
+def file_publisher(output_path):
+    r"""Publisher writing the latest estimate and forecast to *output_path*
+
+    The slip estimate of every update is appended to slip_estimates.txt and
+    gauge_forecast.txt is replaced with the latest forecast.
+    """
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    def publish(assimilation, batch, latency):
+        mean, std = assimilation.slip_estimate()
+        t_latest = max([observation[0] for observation in batch])
+        with open(os.path.join(output_path, "slip_estimates.txt"), 'a') \
+                                                            as estimate_file:
+            estimate_file.write("%s %s %s\n" % (t_latest,
+                                        " ".join([str(x) for x in mean]),
+                                        " ".join([str(x) for x in std])))
+        forecast = assimilation.gauge_forecast()
+        numpy.savetxt(os.path.join(output_path, "gauge_forecast.txt"),
+                      numpy.vstack((assimilation.forecast_times, forecast)).T,
+                      header="t " + " ".join([str(gauge_id) for gauge_id
+                                    in assimilation.forward_model.gauge_ids]))
+        print("t = %s: assimilated %s observations (%s total) in %s s"
+                    % (t_latest, len(batch), assimilation.num_observations,
+                       latency))
+        print("  slips = %s" % mean)
+
+    return publish
+
+
+if __name__ == '__main__':
+
+    import forward_models
+
+    if len(sys.argv) < 3:
+        print("Usage: python streaming_assimilation.py surrogate.npz "
+              "observations.txt [output]")
+        sys.exit(1)
+
+    output_path = sys.argv[3] if len(sys.argv) > 3 else "_assimilation"
+
+    model = forward_models.SurrogateForwardModel.load(sys.argv[1])
+    lower, upper = design.spaces["slip"]
+    random = numpy.random.RandomState()
+    Pa = (lower + (upper - lower) * random.uniform(size=(1000, 6))).T
+
+    assimilation = StreamingAssimilation(model, Pa, random=random)
+    assimilation.run(tail_observations(sys.argv[2], timeout=600.0),
+                     publish=file_publisher(output_path))
+
+    latencies = numpy.array(assimilation.latencies)
+    if len(latencies) > 0:
+        print("Updates = %s, mean latency = %s s, max latency = %s s"
+              % (len(latencies), numpy.mean(latencies), numpy.max(latencies)))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""Fit subdivided plane faults to the UCSB seafloor deformation.
+
+The final seafloor deformation of the UCSB fault is computed once on a common
+grid, as is the deformation of a unit slip on each subfault of a candidate
+`nstrike x ndip` subdivision of the plane fault used in the study.  Since the
+deformation is linear in the slips, the slips of a subdivision best matching
+the UCSB deformation solve a small non-negative least squares problem.  The
+relative residual of each subdivision, together with the number of slips and
+the number of runs an order 2 surrogate would need, shows how few parameters
+the polynomial chaos study can use.
+
+All deformations are cached in `dtopo_cache/` so only new subdivisions need
+the Okada computations.
+
+Command line usage:
+
+    python subdivision_fit.py [NSTRIKExNDIP ...]
+
+e.g. `python subdivision_fit.py 3x2 4x2 6x3`, defaults to
+`default_subdivisions`.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import time
+
+import numpy
+import scipy.optimize
+
+import clawpack.geoclaw.dtopotools as dtopotools
+
+import surrogate
+
+# Common grid the deformations are compared on
+grid_x = numpy.linspace(139.0, 147.0, 241)
+grid_y = numpy.linspace(34.0, 42.0, 241)
+
+cache_path = "dtopo_cache"
+
+default_subdivisions = [(1, 1), (2, 1), (3, 1), (2, 2), (3, 2), (4, 2),
+                        (5, 2), (6, 2), (4, 3), (6, 3), (8, 4)]
+
+
+def base_subfault():
+    r"""Plane fault covering the UCSB reconstruction used in the study"""
+
+    subfault = dtopotools.SubFault()
+    subfault.strike = 198.0
+    subfault.length = 19 * 25.0 * 1000.0
+    subfault.width = 10 * 20.0 * 1000.0
+    subfault.depth = 7.50520 * 1000.0
+    subfault.slip = 1.0
+    subfault.rake = 90.0
+    subfault.dip = 10.0
+    subfault.latitude = 37.64165
+    subfault.longitude = 143.72745
+    subfault.coordinate_specification = "top center"
+    return subfault
+
+
+def final_deformation(fault, x=grid_x, y=grid_y):
+    r"""Final vertical seafloor deformation of *fault* on the grid (x, y)"""
+
+    dtopo = fault.create_dtopography(x, y, times=[1.0])
+    return dtopo.dZ[-1, :, :]
+
+
+def UCSB_deformation(path='./UCSB_model3_subfault.txt', x=grid_x, y=grid_y):
+    r"""Final deformation of the UCSB fault, cached after the first call"""
+
+    cache_file = os.path.join(cache_path, "UCSB.npz")
+    if os.path.exists(cache_file):
+        cache = numpy.load(cache_file)
+        if numpy.array_equal(cache['x'], x) and \
+           numpy.array_equal(cache['y'], y):
+            return cache['dZ']
+
+    # UCSB subfaults rupture in sequence, their final deformation is the
+    # one of the static fault
+    fault = dtopotools.UCSBFault(path)
+    fault.rupture_type = 'static'
+    dZ = final_deformation(fault, x, y)
+
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+    numpy.savez(cache_file, x=x, y=y, dZ=dZ)
+    return dZ
+
+
+def unit_deformations(nstrike, ndip, x=grid_x, y=grid_y):
+    r"""Deformation of a unit slip on each subfault of a subdivision
+
+    Returns an array of shape (nstrike * ndip, len(y), len(x)) ordered as the
+    subfaults of `dtopotools.SubdividedPlaneFault`, along with the time (s)
+    spent computing it (zero if read from the cache).
+    """
+
+    cache_file = os.path.join(cache_path, "unit_%sx%s.npz" % (nstrike, ndip))
+    if os.path.exists(cache_file):
+        cache = numpy.load(cache_file)
+        if numpy.array_equal(cache['x'], x) and \
+           numpy.array_equal(cache['y'], y):
+            return cache['dZ'], 0.0
+
+    start = time.time()
+    subdivided = dtopotools.SubdividedPlaneFault(base_subfault(),
+                                                 nstrike=nstrike, ndip=ndip)
+    dZ = numpy.empty((len(subdivided.subfaults), len(y), len(x)))
+    for (k, subfault) in enumerate(subdivided.subfaults):
+        subfault.slip = 1.0
+        fault = dtopotools.Fault()
+        fault.subfaults = [subfault]
+        dZ[k] = final_deformation(fault, x, y)
+    build_time = time.time() - start
+
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+    numpy.savez(cache_file, x=x, y=y, dZ=dZ)
+    return dZ, build_time
+
+
+def fit_subdivision(target, unit_dZ):
+    r"""Non-negative least squares slips matching the deformation *target*
+
+    Returns the slips and the residual relative to the norm of *target*.
+    """
+
+    A = unit_dZ.reshape((unit_dZ.shape[0], -1)).T
+    b = target.ravel()
+    slips, residual = scipy.optimize.nnls(A, b)
+    return slips, residual / numpy.linalg.norm(b)
+
+
+def compare_subdivisions(subdivisions=default_subdivisions, order=2):
+    r"""Fit every subdivision in *subdivisions* to the UCSB deformation
+
+    Returns a list of dictionaries with the subdivision, its fitted slips,
+    relative residual, number of order *order* surrogate terms and the
+    build and solve times (s).
+    """
+
+    target = UCSB_deformation()
+
+    results = []
+    for (nstrike, ndip) in subdivisions:
+        unit_dZ, build_time = unit_deformations(nstrike, ndip)
+        start = time.time()
+        slips, residual = fit_subdivision(target, unit_dZ)
+        results.append({"nstrike": nstrike, "ndip": ndip,
+                        "num_slips": nstrike * ndip,
+                        "num_terms": surrogate.total_degree_indices(
+                                            nstrike * ndip, order).shape[0],
+                        "slips": slips, "residual": residual,
+                        "build_seconds": build_time,
+                        "solve_seconds": time.time() - start})
+
+    return results
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        subdivisions = [tuple(int(n) for n in arg.lower().split("x"))
+                        for arg in sys.argv[1:]]
+    else:
+        subdivisions = default_subdivisions
+
+    results = compare_subdivisions(subdivisions)
+
+    print("%8s %6s %8s %10s %10s %10s" % ("subdiv", "slips", "PC terms",
+                                          "residual", "build (s)",
+                                          "solve (s)"))
+    for result in sorted(results, key=lambda result: result["num_slips"]):
+        print("%8s %6s %8s %10.4f %10.3f %10.3f"
+                % ("%sx%s" % (result["nstrike"], result["ndip"]),
+                   result["num_slips"], result["num_terms"],
+                   result["residual"], result["build_seconds"],
+                   result["solve_seconds"]))
+        print("    slips = %s" % numpy.round(result["slips"], 2))
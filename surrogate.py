@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""Polynomial surrogates of the DART gauge response to the fault parameters.
+
+The surrogates here are total-degree Legendre expansions fit by least squares
+to the quantities of interest (QoIs) extracted from completed GeoClaw runs.
+The QoI used throughout is the maximum surface elevation at each DART gauge
+inside that gauge's comparison window.
+"""
+
+from __future__ import print_function
+
+import os
+import itertools
+
+import numpy
+
+
+def total_degree_indices(num_dim, order):
+    r"""Return the multi-indices of a total degree *order* basis in *num_dim*.
+
+    The indices are returned as an integer array of shape (num_terms, num_dim)
+    sorted by total degree so that the first rows form the lower order basis.
+    """
+
+    indices = [index for index in itertools.product(range(order + 1),
+                                                    repeat=num_dim)
+                     if sum(index) <= order]
+    indices.sort(key=lambda index: (sum(index), index[::-1]))
+    return numpy.array(indices, dtype=int).reshape((-1, num_dim))
+
+
+def legendre_vandermonde(x, indices):
+    r"""Evaluate the tensor Legendre basis given by *indices* at *x*.
+
+    *x* is an array of shape (N, num_dim) scaled to [-1, 1], the result has
+    shape (N, num_terms).
+    """
+
+    x = numpy.atleast_2d(x)
+    order = int(indices.max()) if indices.size > 0 else 0
+
+    # Three term recurrence for all points and dimensions at once
+    P = numpy.empty(x.shape + (order + 1,))
+    P[..., 0] = 1.0
+    if order > 0:
+        P[..., 1] = x
+    for n in range(1, order):
+        P[..., n + 1] = ((2 * n + 1) * x * P[..., n] - n * P[..., n - 1]) \
+                                                                    / (n + 1)
+
+    V = numpy.ones((x.shape[0], indices.shape[0]))
+    for k in range(x.shape[1]):
+        V *= P[:, k, indices[:, k]]
+    return V
+
+
+class PolynomialSurrogate(object):
+
+    r"""Total degree Legendre polynomial surrogate of a vector valued response.
+
+    Inputs are mapped from the box [*lower*, *upper*] to [-1, 1] before the
+    basis is evaluated.  After :meth:`fit` the leave-one-out residuals are
+    available from the diagonal of the hat matrix, so no refitting is needed
+    to cross-validate the surrogate.  Samples with a leverage within
+    *leverage_tolerance* of 1 are interpolated by the fit whatever their QoI,
+    so their leave-one-out residuals are undefined and left as NaN.
+
+    """
+
+    leverage_tolerance = 1e-8
+
+    def __init__(self, order, lower, upper):
+
+        self.order = order
+        self.lower = numpy.asarray(lower, dtype=float)
+        self.upper = numpy.asarray(upper, dtype=float)
+        self.indices = total_degree_indices(self.lower.shape[0], order)
+
+        self.coefficients = None
+        self.loo_residuals = None
+
+
+    @property
+    def num_terms(self):
+        return self.indices.shape[0]
+
+
+    def scale(self, X):
+        r"""Map *X* from the parameter box to [-1, 1]"""
+        return 2.0 * (numpy.atleast_2d(X) - self.lower) \
+                                / (self.upper - self.lower) - 1.0
+
+
+    def vandermonde(self, X):
+        return legendre_vandermonde(self.scale(X), self.indices)
+
+
+    def fit(self, X, Y):
+        r"""Fit the surrogate to the inputs *X* (N, num_dim) and QoIs *Y*.
+
+        Returns the surrogate so calls can be chained.
+        """
+
+        Y = numpy.asarray(Y, dtype=float)
+        if Y.ndim == 1:
+            Y = Y.reshape((-1, 1))
+        V = self.vandermonde(X)
+        if V.shape[0] <= V.shape[1]:
+            raise ValueError("Need more than %s samples to fit an order %s "
+                             "surrogate, have %s." % (V.shape[1], self.order,
+                                                      V.shape[0]))
+
+        Q, R = numpy.linalg.qr(V)
+        self.coefficients = numpy.linalg.solve(R, numpy.dot(Q.T, Y))
+
+        # Leave-one-out residuals e_i / (1 - h_ii) from the hat matrix
+        leverage = numpy.sum(Q**2, axis=1)
+        residuals = Y - numpy.dot(V, self.coefficients)
+        valid = leverage < 1.0 - self.leverage_tolerance
+        self.loo_residuals = numpy.nan * numpy.ones(residuals.shape)
+        self.loo_residuals[valid] = residuals[valid] \
+                                    / (1.0 - leverage[valid])[:, numpy.newaxis]
+
+        return self
+
+
+    def __call__(self, X, columns=None):
+        r"""Evaluate the surrogate at *X*, optionally only the QoI *columns*"""
+        if self.coefficients is None:
+            raise ValueError("Surrogate has not been fit yet.")
+        coefficients = self.coefficients
+        if columns is not None:
+            coefficients = coefficients[:, columns]
+        return numpy.dot(self.vandermonde(X), coefficients)
+
+
+    def loo_error(self):
+        r"""Root-mean-square leave-one-out error for each QoI
+
+        Samples without a leave-one-out residual are left out, the error is
+        infinite if no sample has one.
+        """
+        valid = numpy.all(numpy.isfinite(self.loo_residuals), axis=1)
+        if not numpy.any(valid):
+            return numpy.inf * numpy.ones(self.loo_residuals.shape[1])
+        return numpy.sqrt(numpy.mean(self.loo_residuals[valid]**2, axis=0))
+
+
+def job_output_path(job, base_path=None):
+    r"""Return the output directory a `batch.Job` writes its results to"""
+
+    if base_path is None:
+        base_path = os.environ.get('DATA_PATH', os.getcwd())
+    return os.path.join(os.path.expanduser(base_path), job.type, job.name,
+                        "%s_output" % job.prefix)
+
+
+def load_gauge_maxima(output_path, gauge_ids, time_limits=None):
+    r"""Extract the maximum surface elevation at each gauge in *gauge_ids*
+
+    If *time_limits* is given it should be a dictionary mapping gauge ids to
+    a (t_start, t_end) window, otherwise the whole gauge record is used.
+    """
+
+    import clawpack.pyclaw.gauges as gauges
+
+    qois = numpy.empty(len(gauge_ids))
+    for (n, gauge_id) in enumerate(gauge_ids):
+        gauge = gauges.GaugeSolution(gauge_id, path=output_path)
+        eta = gauge.q[-1, :]
+        if time_limits is not None and gauge_id in time_limits:
+            t_start, t_end = time_limits[gauge_id]
+            eta = eta[(gauge.t >= t_start) & (gauge.t <= t_end)]
+        qois[n] = numpy.max(eta)
+
+    return qois
+
+
+def load_gauge_series(output_path, gauge_ids, times):
+    r"""Surface elevation at each gauge interpolated to *times*
+
+    Returns an array of shape (len(gauge_ids), len(times)).
+    """
+
+    import clawpack.pyclaw.gauges as gauges
+
+    series = numpy.empty((len(gauge_ids), len(times)))
+    for (n, gauge_id) in enumerate(gauge_ids):
+        gauge = gauges.GaugeSolution(gauge_id, path=output_path)
+        series[n, :] = numpy.interp(times, gauge.t, gauge.q[-1, :])
+
+    return series
+
+
+def dart_gauge_ids():
+    r"""Return the DART gauge numbers requested in setrun.py"""
+
+    import setrun
+    return [gauge[0] for gauge in setrun.setrun().gaugedata.gauges]
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""Binary cache of the ASCII topography files used by setrun.py.
+
+Parsing the etopo ASCII files is a large part of the start up time of every
+run of an ensemble.  Running this module on the topography files converts each
+of them once to NetCDF (GeoClaw topo_type 4):
+
+    python topo_cache.py $SRC/tohoku2011-paper1/topo/*.asc
+
+Converted files are named by a hash of the contents of the original, so an
+edited topography file is converted again instead of using a stale copy.  The
+hash of each original is recorded in an index together with its size and
+modification time.
+
+The cache is opt-in since GeoClaw has to be compiled with NetCDF support to
+read the converted files (`make NETCDF=True`, see the Makefile).  It is used
+when `$TOPO_CACHE_PATH` is set to the cache directory, in which case
+:func:`cached_topofile` returns the converted file of each topography file
+that is in the index and unchanged since, and the ASCII file otherwise.
+:func:`cached_topofile` only reads the index, which is written solely by the
+preprocessing step above, and remembers its answers for the rest of the
+process.
+
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import hashlib
+import tempfile
+
+# NetCDF GeoClaw topography type
+cache_topo_type = 4
+
+# Answers of cached_topofile in this process
+_cached_paths = {}
+
+
+def default_cache_dir():
+    r"""Cache directory `$TOPO_CACHE_PATH`, None if the cache is not in use"""
+    return os.environ.get('TOPO_CACHE_PATH', None)
+
+
+def content_hash(path, block_size=2**20):
+    r"""SHA-1 hex digest of the contents of the file at *path*"""
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as data_file:
+        block = data_file.read(block_size)
+        while len(block) > 0:
+            digest.update(block)
+            block = data_file.read(block_size)
+    return digest.hexdigest()
+
+
+def _atomic_write(path, write):
+    r"""Call *write* with a temporary path and then move it to *path*
+
+    Runs of an ensemble starting at the same time never see a partially
+    written file.
+    """
+
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                         suffix=os.path.splitext(path)[1])
+    os.close(handle)
+    try:
+        write(temp_path)
+        os.chmod(temp_path, 0o644)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _index_path(cache_dir):
+    return os.path.join(cache_dir, "index.json")
+
+
+def read_index(cache_dir):
+    r"""Index of the converted files in *cache_dir*, keyed by original path"""
+
+    try:
+        with open(_index_path(cache_dir), 'r') as index_file:
+            return json.load(index_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _cache_path(path, file_hash, cache_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, "%s_%s.nc" % (name, file_hash))
+
+
+def convert_topofile(path, topo_type=3, cache_dir=None):
+    r"""Convert the topography file at *path* into the cache *cache_dir*
+
+    The preprocessing step, only rehashes and converts the file if its size
+    or modification time changed since the index entry was written.  Returns
+    the path to the converted file.
+    """
+
+    import clawpack.geoclaw.topotools as topotools
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if cache_dir is None:
+        raise ValueError("Set TOPO_CACHE_PATH to the cache directory.")
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    index = read_index(cache_dir)
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    entry = index.get(key)
+    if entry is None or entry['size'] != stat.st_size or \
+                        entry['mtime'] != stat.st_mtime:
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                 'hash': content_hash(path)}
+
+    cache_path = _cache_path(path, entry['hash'], cache_dir)
+    if not os.path.exists(cache_path):
+        def write_topo(temp_path):
+            topo = topotools.Topography(path, topo_type=topo_type)
+            topo.write(temp_path, topo_type=cache_topo_type)
+        _atomic_write(cache_path, write_topo)
+
+    if index.get(key) != entry:
+        index[key] = entry
+
+        def write_index(temp_path):
+            with open(temp_path, 'w') as index_file:
+                json.dump(index, index_file, indent=1, sort_keys=True)
+        _atomic_write(_index_path(cache_dir), write_index)
+
+    return cache_path
+
+
+def cached_topofile(path, topo_type=3, cache_dir=None):
+    r"""Topography type and path to use for a topography file
+
+    Returns the converted copy of the file at *path* if the cache is in use
+    and has an up to date copy, otherwise *topo_type* and *path* unchanged.
+    Never writes to the cache, see :func:`convert_topofile`.
+
+    input
+    -----
+     - *path* (string) Path to the topography file.
+     - *topo_type* (int) GeoClaw topography type of the file.
+     - *cache_dir* (string) Directory holding the converted files, defaults to
+       :func:`default_cache_dir`.
+
+    """
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if cache_dir is None:
+        return topo_type, path
+
+    key = (os.path.abspath(path), topo_type, cache_dir)
+    if key not in _cached_paths:
+        _cached_paths[key] = (topo_type, path)
+        entry = read_index(cache_dir).get(os.path.abspath(path))
+        try:
+            stat = os.stat(path)
+            if entry is not None and entry['size'] == stat.st_size and \
+                                     entry['mtime'] == stat.st_mtime:
+                cache_path = _cache_path(path, entry['hash'], cache_dir)
+                if os.path.exists(cache_path):
+                    _cached_paths[key] = (cache_topo_type, cache_path)
+        except OSError:
+            pass
+        if _cached_paths[key][1] == path:
+            print("Using ASCII topography %s, it is not in the cache %s, "
+                  "see topo_cache.py" % (path, cache_dir))
+
+    return _cached_paths[key]
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print("Usage: TOPO_CACHE_PATH=cache_dir python topo_cache.py "
+              "topofile [topofile ...]")
+        sys.exit(1)
+
+    for path in sys.argv[1:]:
+        print("%s -> %s" % (path, convert_topofile(path)))
@@ -0,0 +1,236 @@
+! Cache of the integrated cell topography of each AMR level
+!
+! The cells of a level lie on a fixed global index space, so a cell covered by
+! a patch after a regrid has the same integrated topography as when an earlier
+! patch covered it.  Values are kept in tiles of tile_size x tile_size cells of
+! that index space, held in a table of num_tiles slots, so that the memory
+! used is bounded (about 12 kB per tile).  A tile hashing to an occupied slot
+! evicts the tile there.  Only topography that no longer moves is cached, see
+! topo_finalized in topo_module.
+!
+! Each slot has its own OpenMP lock, held only while a patch copies cells from
+! or to that tile, so patches set up by different threads only wait for each
+! other when they touch the same tile.  The hit, miss and eviction counters
+! are printed every report_interval calls and at the end of the run.
+module topo_cache_module
+
+    use iso_c_binding, only: c_int, c_funptr, c_funloc
+!$  use omp_lib, only: omp_lock_kind, omp_init_lock
+!$  use omp_lib, only: omp_set_lock, omp_unset_lock
+
+    implicit none
+    save
+
+    integer, parameter :: tile_size = 32
+    integer, parameter :: num_tiles = 2048
+
+    ! Number of calls to setaux between printing the cache counters
+    integer, parameter :: report_interval = 1000
+
+    type topo_tile
+        integer :: level = 0, ti = -1, tj = -1
+        logical :: filled(tile_size, tile_size)
+        real(kind=8) :: values(tile_size, tile_size)
+    end type topo_tile
+
+    type(topo_tile), allocatable :: tiles(:)
+!$  integer(kind=omp_lock_kind), allocatable :: tile_locks(:)
+
+    integer(kind=8) :: cache_hits = 0, cache_misses = 0, cache_evictions = 0
+    integer :: cache_calls = 0
+
+    ! Used to print the counters when the program exits
+    interface
+        integer(c_int) function atexit(handler) bind(c, name='atexit')
+            import :: c_int, c_funptr
+            type(c_funptr), value :: handler
+        end function atexit
+    end interface
+
+contains
+
+    ! Level of patches with spacing dx, dy, 0 if it matches no level
+    integer function topo_cache_level(dx, dy) result(level)
+
+        use amr_module, only: mxnest, hxposs, hyposs
+
+        real(kind=8), intent(in) :: dx, dy
+        integer :: m
+
+        level = 0
+        do m=1,mxnest
+            if (abs(hxposs(m) - dx) <= 1.d-8 * dx .and.                     &
+                abs(hyposs(m) - dy) <= 1.d-8 * dy) level = m
+        enddo
+
+    end function topo_cache_level
+
+
+    ! Allocate the table and its locks on first use
+    subroutine init_topo_cache()
+
+!$      integer :: slot
+
+        !$OMP CRITICAL (topo_cache_init)
+        if (.not. allocated(tiles)) then
+!$          allocate(tile_locks(num_tiles))
+!$          do slot=1,num_tiles
+!$              call omp_init_lock(tile_locks(slot))
+!$          enddo
+            allocate(tiles(num_tiles))
+            if (atexit(c_funloc(report_topo_cache)) /= 0) then
+                print *, 'Warning: topography cache counters will not be ', &
+                         'printed at exit'
+            endif
+        endif
+        !$OMP END CRITICAL (topo_cache_init)
+
+    end subroutine init_topo_cache
+
+
+    ! Print the cache counters, also called when the program exits
+    subroutine report_topo_cache() bind(c)
+
+        print "(a,i12,a,i12,a,i10)", " Topography cache: hits =",            &
+            cache_hits, ", misses =", cache_misses, ", evictions =",         &
+            cache_evictions
+
+    end subroutine report_topo_cache
+
+
+    ! Slot the tile (ti, tj) of level hashes to
+    integer function tile_hash(level, ti, tj) result(slot)
+
+        integer, intent(in) :: level, ti, tj
+        integer(kind=8) :: key
+
+        key = 73856093_8 * ti + 19349663_8 * tj + 83492791_8 * level
+        slot = int(modulo(key, int(num_tiles, kind=8))) + 1
+
+    end function tile_hash
+
+
+    ! Copy the cached topography of the cells of topo, whose cell (i, j) has
+    ! global index (ioffset + i, joffset + j) on level, marking them in found.
+    ! topo is assumed-shape so that a section of aux is not copied.
+    subroutine fetch_cached_topo(level, ioffset, joffset, ilo, jlo, topo, found)
+
+        integer, intent(in) :: level, ioffset, joffset, ilo, jlo
+        real(kind=8), intent(inout) :: topo(ilo:, jlo:)
+        logical, intent(out) :: found(ilo:, jlo:)
+        integer :: i, j, ig, jg, ti, tj, slot, calls
+        integer :: ig_lo, ig_hi, jg_lo, jg_hi
+        integer(kind=8) :: hits
+
+        call init_topo_cache()
+
+        ! Global index range of the cells of topo on the level
+        ig_lo = max(0, ioffset + ilo - 1)
+        ig_hi = ioffset + ubound(topo, 1) - 1
+        jg_lo = max(0, joffset + jlo - 1)
+        jg_hi = joffset + ubound(topo, 2) - 1
+
+        found = .false.
+        hits = 0
+        do tj=jg_lo / tile_size, max(jg_hi, 0) / tile_size
+            do ti=ig_lo / tile_size, max(ig_hi, 0) / tile_size
+                slot = tile_hash(level, ti, tj)
+!$              call omp_set_lock(tile_locks(slot))
+                if (tiles(slot)%level == level .and. tiles(slot)%ti == ti   &
+                                               .and. tiles(slot)%tj == tj) then
+                    do jg=max(jg_lo, tj * tile_size),                       &
+                          min(jg_hi, (tj + 1) * tile_size - 1)
+                        j = jg - joffset + 1
+                        do ig=max(ig_lo, ti * tile_size),                   &
+                              min(ig_hi, (ti + 1) * tile_size - 1)
+                            i = ig - ioffset + 1
+                            if (tiles(slot)%filled(ig - ti * tile_size + 1, &
+                                                   jg - tj * tile_size + 1)) then
+                                topo(i, j) = tiles(slot)%values(            &
+                                                    ig - ti * tile_size + 1, &
+                                                    jg - tj * tile_size + 1)
+                                found(i, j) = .true.
+                                hits = hits + 1
+                            endif
+                        enddo
+                    enddo
+                endif
+!$              call omp_unset_lock(tile_locks(slot))
+            enddo
+        enddo
+
+        !$OMP ATOMIC
+        cache_hits = cache_hits + hits
+
+        !$OMP ATOMIC CAPTURE
+        cache_calls = cache_calls + 1
+        calls = cache_calls
+        !$OMP END ATOMIC
+        if (mod(calls, report_interval) == 0) call report_topo_cache()
+
+    end subroutine fetch_cached_topo
+
+
+    ! Store the topography of the cells of topo that were computed, those
+    ! marked in computed, see fetch_cached_topo
+    subroutine store_cached_topo(level, ioffset, joffset, ilo, jlo, topo,     &
+                                 computed)
+
+        integer, intent(in) :: level, ioffset, joffset, ilo, jlo
+        real(kind=8), intent(in) :: topo(ilo:, jlo:)
+        logical, intent(in) :: computed(ilo:, jlo:)
+        integer :: i, j, ig, jg, ti, tj, slot
+        integer :: ig_lo, ig_hi, jg_lo, jg_hi
+        integer(kind=8) :: misses, evictions
+
+        call init_topo_cache()
+
+        ig_lo = max(0, ioffset + ilo - 1)
+        ig_hi = ioffset + ubound(topo, 1) - 1
+        jg_lo = max(0, joffset + jlo - 1)
+        jg_hi = joffset + ubound(topo, 2) - 1
+
+        misses = 0
+        evictions = 0
+        do tj=jg_lo / tile_size, max(jg_hi, 0) / tile_size
+            do ti=ig_lo / tile_size, max(ig_hi, 0) / tile_size
+                slot = tile_hash(level, ti, tj)
+!$              call omp_set_lock(tile_locks(slot))
+                do jg=max(jg_lo, tj * tile_size),                           &
+                      min(jg_hi, (tj + 1) * tile_size - 1)
+                    j = jg - joffset + 1
+                    do ig=max(ig_lo, ti * tile_size),                       &
+                          min(ig_hi, (ti + 1) * tile_size - 1)
+                        i = ig - ioffset + 1
+                        if (.not. computed(i, j)) cycle
+
+                        ! Claim the slot for this tile, evicting its tile
+                        if (tiles(slot)%level /= level .or.                 &
+                            tiles(slot)%ti /= ti .or.                       &
+                            tiles(slot)%tj /= tj) then
+                            if (tiles(slot)%level > 0) evictions = evictions + 1
+                            tiles(slot)%level = level
+                            tiles(slot)%ti = ti
+                            tiles(slot)%tj = tj
+                            tiles(slot)%filled = .false.
+                        endif
+
+                        tiles(slot)%values(ig - ti * tile_size + 1,         &
+                                           jg - tj * tile_size + 1) = topo(i, j)
+                        tiles(slot)%filled(ig - ti * tile_size + 1,         &
+                                           jg - tj * tile_size + 1) = .true.
+                        misses = misses + 1
+                    enddo
+                enddo
+!$              call omp_unset_lock(tile_locks(slot))
+            enddo
+        enddo
+
+        !$OMP ATOMIC
+        cache_misses = cache_misses + misses
+        !$OMP ATOMIC
+        cache_evictions = cache_evictions + evictions
+
+    end subroutine store_cached_topo
+
+end module topo_cache_module
@@ -2,9 +2,10 @@
 
 import sys
 import os
+import itertools
 
 import numpy
-import scipy.interpolate as interp
+import scipy.sparse
 import matplotlib.pyplot as plt
 
 import clawpack.visclaw.colormaps as colormaps
@@ -24,24 +25,149 @@ def read_deformation(path):
     return extents, x, y, z
 
 
-def project_deformation(extents, x, y, z):
-    r""""""
+def projection_grid(extents, x, y):
+    r"""Grid covering *extents* at the minimum spacing of the points (x, y)"""
 
-    # Construct new grid
     num_cells = [ int((extents[2] - extents[0]) / numpy.min(numpy.abs(numpy.diff(x)))),
                   int((extents[3] - extents[1]) / numpy.min(numpy.abs(numpy.diff(y)))) ]
-    t = numpy.array([0.0,1.0])
-    X, Y = numpy.meshgrid(numpy.linspace(extents[0],extents[2],num_cells[0]), 
+    return numpy.meshgrid(numpy.linspace(extents[0],extents[2],num_cells[0]), 
                           numpy.linspace(extents[1],extents[3],num_cells[1]))
-    Z = numpy.zeros((num_cells[1], num_cells[0], 2))
-    Z[:,:,1] = interp.griddata((x, y), z, (X, Y), method='linear', fill_value=0.0)
 
-    return t, X, Y, Z
 
+class DeformationProjector(object):
+    r"""Linear interpolation from scattered points (x, y) to the grid X, Y
+
+    The Delaunay triangulation of the points is computed once and the
+    barycentric weights of every grid point are stored as a sparse matrix, so
+    projecting a field is a sparse matrix-vector product.  The results agree
+    with *scipy.interpolate.griddata* with *method='linear'*.  Grid points
+    outside of the convex hull of the points are set to *fill_value*.
+
+    The weights can be saved with *save* and reloaded with *load* so the
+    triangulation is only done once for a set of points.
+
+    """
+
+    def __init__(self, x, y, X, Y, fill_value=0.0):
+
+        import scipy.spatial
+
+        points = numpy.column_stack((numpy.ravel(x), numpy.ravel(y)))
+        targets = numpy.column_stack((X.ravel(), Y.ravel()))
+        triangulation = scipy.spatial.Delaunay(points)
+
+        simplices = triangulation.find_simplex(targets)
+        inside = simplices >= 0
+        transform = triangulation.transform[simplices[inside]]
+        barycentric = numpy.einsum('ijk,ik->ij', transform[:, :2, :],
+                                   targets[inside] - transform[:, 2, :])
+        weights = numpy.column_stack((barycentric,
+                                      1.0 - numpy.sum(barycentric, axis=1)))
+
+        rows = numpy.repeat(numpy.nonzero(inside)[0], 3)
+        columns = triangulation.simplices[simplices[inside]].ravel()
+        self._set_weights(scipy.sparse.csr_matrix(
+                                (weights.ravel(), (rows, columns)),
+                                shape=(targets.shape[0], points.shape[0])),
+                          ~inside, X, Y, fill_value)
+
+
+    def _set_weights(self, weights, outside, X, Y, fill_value):
+        self.weights = weights
+        self.outside = outside
+        self.X = X
+        self.Y = Y
+        self.fill_value = fill_value
+
+
+    def __call__(self, z):
+        r"""Project the field *z* given at the points onto the grid
+
+        *z* may also hold one field per column, shape (num_points, N), in which
+        case the result has shape X.shape + (N,).
+        """
+
+        z = numpy.asarray(z)
+        Z = self.weights.dot(z)
+        Z[self.outside] = self.fill_value
+        return Z.reshape(self.X.shape + z.shape[1:])
+
+
+    def save(self, path):
+        r"""Save the projector to the numpy archive at *path*"""
+        numpy.savez(path, data=self.weights.data, indices=self.weights.indices,
+                    indptr=self.weights.indptr, shape=self.weights.shape,
+                    outside=self.outside, X=self.X, Y=self.Y,
+                    fill_value=self.fill_value)
+
+
+    @classmethod
+    def load(cls, path):
+        r"""Load a projector saved with *save*"""
+
+        data = numpy.load(path)
+        projector = cls.__new__(cls)
+        projector._set_weights(scipy.sparse.csr_matrix(
+                                    (data['data'], data['indices'],
+                                     data['indptr']),
+                                    shape=tuple(data['shape'])),
+                               data['outside'], data['X'], data['Y'],
+                               float(data['fill_value']))
+        return projector
+
+
+def project_deformation(extents, x, y, z, projector=None):
+    r"""Project the deformation *z* at the points (x, y) onto a regular grid
+
+    If a :class:`DeformationProjector` for the points is given as *projector*
+    its grid and weights are used instead of triangulating the points again.
+    """
+
+    # Construct new grid
+    if projector is None:
+        X, Y = projection_grid(extents, x, y)
+        projector = DeformationProjector(x, y, X, Y)
+
+    t = numpy.array([0.0,1.0])
+    Z = numpy.zeros(projector.X.shape + (2,))
+    Z[:,:,1] = projector(z)
+
+    return t, projector.X, projector.Y, Z
+
+
+def dtopo_header(t, X, Y):
+    r"""Header of a type 2 or 3 dtopo file for the grid *X*, *Y* and times *t*
+
+    input
+    -----
+     - *t* (numpy.ndarray[:]) - Array containing time points.
+     - *X* (numpy.ndarray[:,:]) - Array containing x-coodinates (longitude), 
+       should be in the form given by *numpy.meshgrid*.
+     - *Y* (numpy.ndarray[:,:]) - Array containing y-coordinates (latitude),
+       should be in the form given by *numpy.meshgrid*.
 
-def write_deformation_to_file(t, X, Y, Z, output_file, topo_type=1):
+    """
+
+    dt = t[1] - t[0] if t.shape[0] > 1 else 0.0
+    header = "%7i       mx\n" % X.shape[1]
+    header += "%7i       my\n" % X.shape[0]
+    header += "%7i       mt\n" % t.shape[0]
+    header += "%20.14e   xlower\n" % X[0, 0]
+    header += "%20.14e   ylower\n" % Y[0, 0]
+    header += "%20.14e   t0\n" % t[0]
+    header += "%20.14e   dx\n" % (X[0, 1] - X[0, 0])
+    header += "%20.14e   dy\n" % (Y[1, 0] - Y[0, 0])
+    header += "%20.14e   dt\n" % dt
+    return header
+
+
+def write_deformation_to_file(t, X, Y, Z, output_file, topo_type=1,
+                              binary=False, fmt="%.15g", block_size=2**16):
     r"""Write out a dtopo file to *output_file*
 
+    Each block of about *block_size* values is formatted with a single string
+    operation and written at once.
+
     input
     -----
      - *t* (numpy.ndarray[:]) - Array containing time points, note that 
@@ -54,91 +180,270 @@ def write_deformation_to_file(t, X, Y, Z, output_file, topo_type=1):
        bathymetry.
      - *output_file* (path) - Path to the output file to written to.
      - *topo_type* (int) - Type of topography file to write out.  Default is 1.
+     - *binary* (bool) - Write the type 2/3 header followed by the raw little
+       endian float64 deformation, ordered as in a type 3 file, instead of
+       text.  Default is False.
+     - *fmt* (string) - Format of each value in text files.
+     - *block_size* (int) - Number of values formatted and written at once.
 
     """
 
-    # Temporary catch for non implemented topo_type input
-    if topo_type != 1:
-        raise NotImplementedError("Topography types 2 and 3 are not yet supported.")
-
-    # Construct each interpolating function and evaluate at new grid
-    try:
-        outfile = open(output_file, 'w')
-
-        if topo_type == 1:
-            # Topography file with 4 columns, t, x, y, dz written from the upper
-            # left corner of the region
-            Y_flipped = numpy.flipud(Y)
-            for n in xrange(t.shape[0]):
-                Z_flipped = numpy.flipud(Z[:,:,n])
-                for j in xrange(Y.shape[0]):
-                    for i in xrange(X.shape[1]):
-                        outfile.write("%s %s %s %s\n" % (t[n], X[j,i], Y_flipped[j,i], Z_flipped[j,i]))
-    
-        elif topo_type == 2 or topo_type == 3:
-            raise NotImplementedError("Topography types 2 and 3 are not yet supported.")
-        else:
-            raise ValueError("Only topography types 1, 2, and 3 are supported.")
+    if topo_type not in [1, 2, 3]:
+        raise ValueError("Only topography types 1, 2, and 3 are supported.")
 
-    except IOError as e:
-        raise e
-    finally:
-        outfile.close()
+    t = numpy.asarray(t)
 
+    with open(output_file, 'wb') as outfile:
+        if binary or topo_type != 1:
+            outfile.write(dtopo_header(t, X, Y).encode())
+        for n in range(t.shape[0]):
+            write_deformation_slice(outfile, t[n], X, Y, Z[:, :, n],
+                                    topo_type=topo_type, binary=binary,
+                                    fmt=fmt, block_size=block_size)
 
-def read_dtopo_file(path, topo_type=1):
-    r""""""
 
-    if topo_type != 1:
-        raise ValueError("Topography type != 1 is not implemented.")
+def write_deformation_slice(outfile, t, X, Y, dz, topo_type=1, binary=False,
+                            fmt="%.15g", block_size=2**16):
+    r"""Write the deformation *dz* at time *t* to the open file *outfile*
 
-    # Load raw data
-    data = numpy.loadtxt(path)
+    Writes the body of one time slice of a dtopo file, see
+    *write_deformation_to_file* for the arguments.  Headers of type 2 and 3
+    files are written separately with *dtopo_header*.
+
+    """
+
+    if binary:
+        # Straight from the buffer from the upper left corner of the region
+        numpy.ascontiguousarray(numpy.flipud(dz), dtype='<f8').tofile(outfile)
+        return
+
+    dz = numpy.flipud(dz).ravel()
+    if topo_type == 1:
+        # Topography file with 4 columns, t, x, y, dz written from the upper
+        # left corner of the region
+        values = numpy.column_stack((numpy.ones(dz.shape) * t, X.ravel(),
+                                     numpy.flipud(Y).ravel(), dz)).ravel()
+        values_per_line = 4
+    else:
+        # Type 2 has one value per line, type 3 one row of the grid
+        values = dz
+        values_per_line = 1 if topo_type == 2 else X.shape[1]
+
+    line_format = " ".join([fmt] * values_per_line) + "\n"
+    block_values = max(block_size // values_per_line, 1) * values_per_line
+    for start in range(0, values.shape[0], block_values):
+        block = values[start:start + block_values]
+        num_lines = block.shape[0] // values_per_line
+        outfile.write(((line_format * num_lines) % tuple(block)).encode())
 
-    # Parse data
-    t = data[:,0]
-    x = data[:,1]
-    y = data[:,2]
-
-    # Initialize extents
-    t0 = t[0]
-    lower = [x[0], y[0]]
-    upper = [None, None]
-    num_cells = [0,0]
-
-    # Count total x-values
-    for row in xrange(1,data.shape[0]):
-        if x[row] == x[0]:
-            num_cells[0] = row
-            break
-
-    # Count total y-values
-    for row in xrange(num_cells[0], data.shape[0]):
-        if t[row] != t0:
-            num_cells[1] = row / num_cells[0]
-            num_times = data.shape[0] / row
-            break
-
-    # Check extents
-    assert(t[0] != t[num_cells[0] * num_cells[1] + 1])
-    # assert(t[0] == t[num_cells[0] * num_cells[1]])
-
-    # Fill in rest of pertinent data
-    t = data[::num_cells[0] * num_cells[1], 0]
-    x = data[:num_cells[0], 1]
-    y = data[:num_cells[0] * num_cells[1]:num_cells[0], 2]
-    upper = [x[-1], y[-1]]
+
+def read_dtopo_header(dtopo_file):
+    r"""Read the 9 line header of a type 2 or 3 dtopo file
+
+    Returns the times and the grid as given by *numpy.meshgrid*, leaving
+    *dtopo_file* at the first deformation value.
+    """
+
+    values = [float(dtopo_file.readline().split()[0]) for n in range(9)]
+    num_cells = [int(values[0]), int(values[1])]
+    num_times = int(values[2])
+    x = values[3] + values[6] * numpy.arange(num_cells[0])
+    y = values[4] + values[7] * numpy.arange(num_cells[1])
+    t = values[5] + values[8] * numpy.arange(num_times)
     X, Y = numpy.meshgrid(x, y)
-    Z = numpy.empty( (num_times, num_cells[0], num_cells[1]) )
+    return t, X, Y
+
 
-    for (n,time) in enumerate(t):
-        Z[n,:,:] = data[num_cells[0] * num_cells[1] * n:
-                        num_cells[0] * num_cells[1] * (n+1), 3].reshape(
-                                (num_cells[0], num_cells[1]))
+def read_dtopo_file(path, topo_type=1, binary=False, sidecar=False):
+    r"""Read the dtopo file at *path*
+
+    The deformation is returned as an array *Z* of shape (nt, ny, nx) whose
+    rows are ordered as the rows of *Y*, i.e. from the lower left corner.
+
+    input
+    -----
+     - *path* (path) - Path to the dtopo file.
+     - *topo_type* (int) - Type of the topography file, 1, 2 or 3.
+     - *binary* (bool) - The file was written by *write_deformation_to_file*
+       with *binary=True*.  *Z* is then a view of a read-only *numpy.memmap*
+       of the file so nothing is read until used.
+     - *sidecar* (bool) - Read text files through a binary copy at
+       `<path>.bin`, written on the first read and used while it is newer
+       than *path*.
+
+    """
+
+    if sidecar and not binary:
+        sidecar_path = path + ".bin"
+        if not os.path.exists(sidecar_path) or \
+           os.path.getmtime(sidecar_path) < os.path.getmtime(path):
+            t, X, Y, Z = read_dtopo_file(path, topo_type=topo_type)
+            write_deformation_to_file(t, X, Y, numpy.rollaxis(Z, 0, 3),
+                                      sidecar_path, binary=True)
+        return read_dtopo_file(sidecar_path, binary=True)
+
+    if binary:
+        with open(path, 'rb') as dtopo_file:
+            t, X, Y = read_dtopo_header(dtopo_file)
+            offset = dtopo_file.tell()
+        Z = numpy.memmap(path, dtype='<f8', mode='r', offset=offset,
+                         shape=(t.shape[0], X.shape[0], X.shape[1]))
+        return t, X, Y, Z[:, ::-1, :]
+
+    if topo_type == 1:
+        # Columns t, x, y, dz written from the upper left corner
+        with open(path, 'r') as dtopo_file:
+            data = numpy.fromstring(dtopo_file.read(), sep=" ").reshape((-1, 4))
+
+        # Grid shape from the first repeat of x and change of t
+        repeats = numpy.nonzero(data[1:, 1] == data[0, 1])[0]
+        num_x = repeats[0] + 1 if repeats.shape[0] > 0 else data.shape[0]
+        changes = numpy.nonzero(data[:, 0] != data[0, 0])[0]
+        num_points = changes[0] if changes.shape[0] > 0 else data.shape[0]
+        num_y = num_points // num_x
+        num_times = data.shape[0] // num_points
+        if num_x * num_y * num_times != data.shape[0]:
+            raise ValueError("Could not determine the grid of the dtopo file "
+                             "at %s." % path)
+
+        t = data[::num_points, 0]
+        x = data[:num_x, 1]
+        y = data[:num_points:num_x, 2][::-1]
+        X, Y = numpy.meshgrid(x, y)
+        Z = data[:, 3].reshape((num_times, num_y, num_x))[:, ::-1, :]
+
+    elif topo_type == 2 or topo_type == 3:
+        with open(path, 'r') as dtopo_file:
+            t, X, Y = read_dtopo_header(dtopo_file)
+            Z = numpy.fromstring(dtopo_file.read(), sep=" ")
+        Z = Z.reshape((t.shape[0], X.shape[0], X.shape[1]))[:, ::-1, :]
+
+    else:
+        raise ValueError("Only topography types 1, 2, and 3 are supported.")
 
     return t, X, Y, Z
 
 
+def read_deformation_chunks(path, num_columns=None, chunk_lines=2**16):
+    r"""Yield the rows of the deformation file at *path* in chunks
+
+    Each chunk is an array of at most *chunk_lines* rows of *num_columns*
+    columns, 4 for txydz files (t, x, y, dz) and 3 for xyz files (x, y, dz).
+    By default the number of columns of the first row is used.
+    """
+
+    with open(path, 'r') as deformation_file:
+        while True:
+            lines = list(itertools.islice(deformation_file, chunk_lines))
+            if len(lines) == 0:
+                break
+            data = numpy.fromstring("".join(lines), sep=" ")
+            if num_columns is None:
+                num_columns = len(lines[0].split())
+            yield data.reshape((-1, num_columns))
+
+
+def stream_deformation(input_path, output_file, X, Y, topo_type=3,
+                       num_columns=None, chunk_lines=2**16, projector=None,
+                       fill_value=0.0, binary=False):
+    r"""Convert a txydz or xyz deformation file to a dtopo file in chunks
+
+    The input is read *chunk_lines* rows at a time and each row is added to
+    the grid cell of *X*, *Y* containing it.  When the time changes the cell
+    averages are written out as a time slice, cells without any input point
+    are set to *fill_value*, so memory use is bounded by one output time
+    slice regardless of the size of the input.  Rows of the same time must
+    be contiguous, xyz files are a single slice at t = 0.
+
+    If a :class:`DeformationProjector` from the points of a time slice is
+    given as *projector* the slices are interpolated with it instead of
+    binned, this needs the deformation values of one input slice in memory.
+
+    The type 2 and 3 header is rewritten once the number of times is known.
+    Returns the times written.
+
+    input
+    -----
+     - *input_path* (path) - Path to the txydz or xyz file.
+     - *output_file* (path) - Path to the dtopo file written.
+     - *X*, *Y* (numpy.ndarray[:,:]) - Uniform output grid as given by
+       *numpy.meshgrid*.
+     - *topo_type* (int) - Type of the dtopo file, 1, 2 or 3.  Default is 3.
+     - *num_columns* (int) - Columns in the input, 4 (txydz) or 3 (xyz).
+     - *chunk_lines* (int) - Number of input lines read at once.
+     - *binary* (bool) - Write a binary file, see
+       *write_deformation_to_file*.
+
+    """
+
+    num_cells = [X.shape[1], X.shape[0]]
+    lower = [X[0, 0], Y[0, 0]]
+    delta = [X[0, 1] - X[0, 0], Y[1, 0] - Y[0, 0]]
+
+    times = []
+    current = {"t": None, "sum": None, "count": None, "z": []}
+
+    def add(t, x, y, z):
+        if projector is not None:
+            current["z"].append(z)
+            return
+        i = numpy.floor((x - lower[0]) / delta[0] + 0.5).astype(int)
+        j = numpy.floor((y - lower[1]) / delta[1] + 0.5).astype(int)
+        inside = (i >= 0) & (i < num_cells[0]) & (j >= 0) & (j < num_cells[1])
+        cells = j[inside] * num_cells[0] + i[inside]
+        current["sum"] += numpy.bincount(cells, weights=z[inside],
+                                         minlength=current["sum"].shape[0])
+        current["count"] += numpy.bincount(cells,
+                                           minlength=current["sum"].shape[0])
+
+    def start(t):
+        current["t"] = t
+        current["sum"] = numpy.zeros(num_cells[0] * num_cells[1])
+        current["count"] = numpy.zeros(num_cells[0] * num_cells[1], dtype=int)
+        current["z"] = []
+
+    def finish(outfile):
+        if projector is not None:
+            dz = projector(numpy.concatenate(current["z"]))
+        else:
+            dz = numpy.ones(current["sum"].shape) * fill_value
+            filled = current["count"] > 0
+            dz[filled] = current["sum"][filled] / current["count"][filled]
+            dz = dz.reshape(X.shape)
+        if len(times) == 0 and (binary or topo_type != 1):
+            outfile.write(dtopo_header(numpy.array([current["t"]]),
+                                       X, Y).encode())
+        write_deformation_slice(outfile, current["t"], X, Y, dz,
+                                topo_type=topo_type, binary=binary)
+        times.append(current["t"])
+
+    with open(output_file, 'wb') as outfile:
+        for data in read_deformation_chunks(input_path, num_columns,
+                                            chunk_lines):
+            if data.shape[1] == 3:
+                data = numpy.column_stack((numpy.zeros(data.shape[0]), data))
+
+            # Split the chunk where the time changes
+            breaks = numpy.nonzero(numpy.diff(data[:, 0]))[0] + 1
+            for segment in numpy.split(data, breaks):
+                if current["t"] is None:
+                    start(segment[0, 0])
+                elif segment[0, 0] != current["t"]:
+                    finish(outfile)
+                    start(segment[0, 0])
+                add(segment[0, 0], segment[:, 1], segment[:, 2],
+                    segment[:, 3])
+
+        if current["t"] is not None:
+            finish(outfile)
+
+        # Header now that all of the times are known, same length as before
+        if binary or topo_type != 1:
+            outfile.seek(0)
+            outfile.write(dtopo_header(numpy.array(times), X, Y).encode())
+
+    return numpy.array(times)
+
 
 if __name__ == "__main__":
 